@@ -0,0 +1,208 @@
+# ==============================================================================
+# EXPANSOR DE PALAVRAS-CHAVE - "CRIAR ANÚNCIO RÁPIDO"
+# ==============================================================================
+# Gera variações de palavras-chave a partir de termos-semente, usando:
+# - modificadores de intenção (compra, proximidade, comparação, informação)
+# - modificadores de localização (cidade/bairro do termo ou informados)
+# - sinônimos de um dicionário local (sem chamadas externas)
+# As variações são deduplicadas por forma normalizada (conjunto de hashes) e
+# pontuadas/ranqueadas em lote com NumPy. O modo em lote atende contas de agência
+# com milhares de sementes por vez.
+import re
+import numpy as np
+
+# --- Dicionário local de sinônimos (forma normalizada, sem acentos) ---
+SINONIMOS = {
+    "restaurante": ["restaurantes", "lugar para comer", "onde comer"],
+    "culinaria": ["comida", "cozinha"],
+    "comida": ["culinaria", "refeicao", "prato"],
+    "lanchonete": ["lanches", "hamburgueria"],
+    "pizzaria": ["pizza", "pizzas"],
+    "marmitex": ["marmita", "quentinha", "prato feito"],
+    "almoco": ["prato do dia", "refeicao"],
+    "loja": ["lojas", "onde comprar"],
+    "roupa": ["roupas", "moda"],
+    "roupas": ["moda", "vestuario"],
+    "salao": ["cabeleireiro", "studio de beleza"],
+    "cabeleireiro": ["salao de beleza", "corte de cabelo"],
+    "barbearia": ["barbeiro", "corte masculino"],
+    "academia": ["musculacao", "crossfit"],
+    "dentista": ["clinica odontologica", "odontologia"],
+    "advogado": ["escritorio de advocacia", "advocacia"],
+    "contador": ["contabilidade", "escritorio de contabilidade"],
+    "mecanica": ["oficina mecanica", "mecanico"],
+    "oficina": ["mecanica", "auto center"],
+    "pet": ["petshop", "banho e tosa"],
+    "petshop": ["pet shop", "banho e tosa"],
+    "conserto": ["reparo", "assistencia tecnica"],
+    "curso": ["cursos", "aulas", "treinamento"],
+    "barato": ["em conta", "preco baixo"],
+    "delivery": ["entrega", "tele entrega"],
+}
+
+# --- Modificadores de intenção: (modelo, classe de intenção) ---
+INTENCAO_NUCLEO, INTENCAO_TRANSACIONAL, INTENCAO_LOCAL, INTENCAO_COMPARACAO, INTENCAO_INFORMACIONAL = range(5)
+NOMES_INTENCAO = ("núcleo", "compra", "local", "comparação", "informação")
+# Peso base de cada intenção para anúncios de pesquisa (quem quer comprar/visitar vale mais).
+PESOS_INTENCAO = np.array([1.0, 0.9, 0.85, 0.7, 0.3], dtype=np.float32)
+
+MODIFICADORES_INTENCAO = (
+    ("{k} perto de mim", INTENCAO_LOCAL),
+    ("{k} aberto agora", INTENCAO_LOCAL),
+    ("{k} mais proximo", INTENCAO_LOCAL),
+    ("{k} delivery", INTENCAO_TRANSACIONAL),
+    ("{k} preco", INTENCAO_TRANSACIONAL),
+    ("{k} promocao", INTENCAO_TRANSACIONAL),
+    ("{k} whatsapp", INTENCAO_TRANSACIONAL),
+    ("melhor {k}", INTENCAO_COMPARACAO),
+    ("{k} barato", INTENCAO_COMPARACAO),
+    ("{k} bom e barato", INTENCAO_COMPARACAO),
+    ("{k} avaliacoes", INTENCAO_COMPARACAO),
+    ("como escolher {k}", INTENCAO_INFORMACIONAL),
+)
+MODELOS_LOCAL = ("{k} em {l}", "{k} {l}")
+
+# Peso de cada feature no score final (ver _pontuar).
+PESO_LOCAL = 0.2
+PENALIDADE_SINONIMO = 0.15
+PENALIDADE_TAMANHO = 0.07
+TAMANHO_IDEAL = 4  # palavras; termos muito curtos são caros e muito longos têm pouco volume
+
+# Frases de intenção que podem vir na própria semente ("pizzaria perto de mim"). São removidas
+# antes de procurar a localização; os modificadores acima voltam a gerá-las nas variações.
+FRASES_INTENCAO = ("perto de mim", "perto daqui", "aberto agora", "aberta agora", "mais proximo", "mais proxima")
+# Complementos que aparecem depois de "em" mas não são lugares ("curso em ingles", "entrega em casa").
+NAO_LOCAIS = {
+    "ingles", "espanhol", "frances", "alemao", "italiano", "libras", "portugues", "casa", "domicilio",
+    "promocao", "oferta", "conta", "dinheiro", "dia", "geral", "grupo", "familia", "pix", "cartao",
+    "video", "ead", "online", "atacado", "varejo", "estoque", "destaque",
+}
+
+_TABELA_ACENTOS = str.maketrans("áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ",
+                                "aaaaaeeeeiiiiooooouuuucnAAAAAEEEEIIIIOOOOOUUUUCN")
+_FRASES_INTENCAO = re.compile(r"\b(?:%s)\b" % "|".join(re.escape(f) for f in FRASES_INTENCAO))
+_SEPARADOR_LOCAL = re.compile(r"\s+em\s+", re.IGNORECASE)
+_ESPACOS = re.compile(r"\s+")
+_PREPOSICOES_LOCAL = {"de", "do", "da", "dos", "das", "e"}
+_PALAVRAS_INTENCAO = {p for frase in FRASES_INTENCAO for p in frase.split()}
+
+
+def normalizar_termo(termo):
+    """Forma canônica usada na deduplicação: minúsculas, sem acentos e com espaços únicos."""
+    return _ESPACOS.sub(" ", termo.lower().translate(_TABELA_ACENTOS)).strip()
+
+
+def _parece_local(trecho_original, trecho_normalizado, locais):
+    """
+    Um trecho depois de "em" só é localização se for um dos 'locais' informados ou se for
+    escrito como nome próprio ("Juiz de Fora", "Zona Sul") e não for um complemento comum.
+    """
+    if trecho_normalizado in locais:
+        return True
+    if trecho_normalizado in NAO_LOCAIS or trecho_normalizado.split()[0] in NAO_LOCAIS:
+        return False
+    # As palavras das frases de intenção já foram removidas do trecho normalizado; ignora-as aqui também.
+    palavras = [p for p in trecho_original.split()
+                if p.lower() not in _PREPOSICOES_LOCAL and normalizar_termo(p) not in _PALAVRAS_INTENCAO]
+    return bool(palavras) and all(p[:1].isupper() for p in palavras)
+
+
+def separar_local(termo, locais=()):
+    """
+    Separa 'Restaurante Mineiro em Juiz de Fora' em ('restaurante mineiro', 'juiz de fora').
+    Frases de intenção ("perto de mim") são removidas antes, e só se aceita uma localização
+    plausível (ver _parece_local). Retorna (nucleo_normalizado, local_normalizado ou None).
+    """
+    normalizado = normalizar_termo(termo)
+    sem_intencao = _ESPACOS.sub(" ", _FRASES_INTENCAO.sub(" ", normalizado)).strip()
+    nucleo = sem_intencao or normalizado
+    partes_originais = _SEPARADOR_LOCAL.split(termo.strip())
+    if len(partes_originais) >= 2:
+        trecho_original = partes_originais[-1]
+        trecho = _ESPACOS.sub(" ", _FRASES_INTENCAO.sub(" ", normalizar_termo(trecho_original))).strip()
+        if trecho and nucleo.endswith(" em " + trecho) and _parece_local(trecho_original, trecho, locais):
+            return nucleo[:-len(" em " + trecho)].strip(), trecho
+    return nucleo, None
+
+
+def _variantes_nucleo(nucleo):
+    """O núcleo original e as versões com um sinônimo trocado por vez. Retorna [(texto, eh_sinonimo)]."""
+    palavras = nucleo.split()
+    variantes = [(nucleo, 0)]
+    for i, palavra in enumerate(palavras):
+        for sinonimo in SINONIMOS.get(palavra, ()):
+            variantes.append((" ".join(palavras[:i] + [sinonimo] + palavras[i + 1:]), 1))
+    return variantes
+
+
+def _gerar_candidatos(semente, locais, vistos, textos, intencoes, flags_local, flags_sinonimo):
+    """Gera as variações de uma semente, anexando nas listas de saída somente as inéditas em 'vistos'."""
+    nucleo, local_semente = separar_local(semente, locais)
+    if not nucleo:
+        return
+    todos_locais = ([local_semente] if local_semente else []) + [l for l in locais if l != local_semente]
+
+    def adicionar(texto, intencao, tem_local, sinonimo):
+        if texto not in vistos:
+            vistos.add(texto)
+            textos.append(texto); intencoes.append(intencao)
+            flags_local.append(tem_local); flags_sinonimo.append(sinonimo)
+
+    for base, sinonimo in _variantes_nucleo(nucleo):
+        adicionar(base, INTENCAO_NUCLEO, 0, sinonimo)
+        for local in todos_locais:
+            for modelo in MODELOS_LOCAL:
+                adicionar(modelo.format(k=base, l=local), INTENCAO_LOCAL, 1, sinonimo)
+        for modelo, intencao in MODIFICADORES_INTENCAO:
+            adicionar(modelo.format(k=base), intencao, 0, sinonimo)
+
+
+def _pontuar(textos, intencoes, flags_local, flags_sinonimo):
+    """Calcula os scores (0 a 100) de todas as variações de uma vez, de forma vetorizada."""
+    n_palavras = np.fromiter((t.count(" ") + 1 for t in textos), dtype=np.float32, count=len(textos))
+    intencoes = np.asarray(intencoes, dtype=np.int8)
+    score = (PESOS_INTENCAO[intencoes]
+             + PESO_LOCAL * np.asarray(flags_local, dtype=np.float32)
+             - PENALIDADE_SINONIMO * np.asarray(flags_sinonimo, dtype=np.float32)
+             - PENALIDADE_TAMANHO * np.abs(n_palavras - TAMANHO_IDEAL))
+    maximo = PESOS_INTENCAO.max() + PESO_LOCAL
+    return np.clip(score / maximo * 100, 0, 100).round(1), intencoes
+
+
+def expandir_em_lote(sementes, locais=None, limite_por_semente=20):
+    """
+    Modo em lote: expande muitas sementes de uma vez.
+    A geração é feita semente a semente, mas a pontuação e o ranking rodam em um único
+    lote NumPy para todas. Retorna {semente: [{palavra_chave, score, intencao}, ...]},
+    com cada lista ordenada do maior para o menor score.
+    """
+    locais = [normalizar_termo(l) for l in (locais or []) if l and l.strip()]
+    textos, intencoes, flags_local, flags_sinonimo, origem = [], [], [], [], []
+    for indice, semente in enumerate(sementes):
+        vistos = set()
+        inicio = len(textos)
+        _gerar_candidatos(semente, locais, vistos, textos, intencoes, flags_local, flags_sinonimo)
+        origem.extend([indice] * (len(textos) - inicio))
+    resultado = {semente: [] for semente in sementes}
+    if not textos:
+        return resultado
+
+    scores, intencoes = _pontuar(textos, intencoes, flags_local, flags_sinonimo)
+    origem = np.asarray(origem, dtype=np.int64)
+    # Ordena por semente e, dentro dela, pelo score decrescente (lexsort usa a última chave como primária).
+    ordem = np.lexsort((-scores, origem))
+    origem_ordenada = origem[ordem]
+    inicios = np.searchsorted(origem_ordenada, np.arange(len(sementes)), side="left")
+    for indice, semente in enumerate(sementes):
+        selecionados = ordem[inicios[indice]:inicios[indice] + limite_por_semente] if limite_por_semente else \
+            ordem[inicios[indice]:np.searchsorted(origem_ordenada, indice, side="right")]
+        resultado[semente] = [
+            {"palavra_chave": textos[i], "score": round(float(scores[i]), 1), "intencao": NOMES_INTENCAO[intencoes[i]]}
+            for i in selecionados if origem[i] == indice
+        ]
+    return resultado
+
+
+def expandir_palavras_chave(semente, locais=None, limite=20):
+    """Expande um único termo-semente. Retorna a lista ranqueada de {palavra_chave, score, intencao}."""
+    return expandir_em_lote([semente], locais=locais, limite_por_semente=limite)[semente]
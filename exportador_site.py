@@ -0,0 +1,231 @@
+# ==============================================================================
+# EXPORTADOR DE SITE ESTÁTICO - MAX CONSTRUTOR
+# ==============================================================================
+# Gera, a partir do 'construtor_state', um site estático completo (index.html +
+# imagens) empacotado em ZIP. O foco é carregar rápido em redes móveis:
+# - CSS crítico embutido no <head> (sem requisições extras para renderizar)
+# - Imagens em WebP com variantes de largura e 'srcset'/'sizes'
+# - Imagens de produtos com loading="lazy" e dimensões declaradas (sem layout shift)
+# - HTML minificado
+# As variantes WebP ficam em cache por imagem: editar textos ou links só remonta o index.html.
+import io
+import re
+import html
+import base64
+import hashlib
+import zipfile
+import datetime
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+from PIL import Image
+
+# Larguras geradas para cada imagem de produto (px). O navegador escolhe pelo 'sizes'.
+LARGURAS_PRODUTO = (320, 480, 768)
+# Larguras geradas para a logo (exibida com no máximo 60px de altura).
+LARGURAS_LOGO = (120, 240)
+QUALIDADE_WEBP = 75
+# Proporção das imagens de produto no grid (mesma do preview: largura x 120px).
+PROPORCAO_PRODUTO = 3 / 4
+MAX_IMAGENS_CACHE = 128  # imagens (com todas as suas variantes) mantidas em memória
+
+_cache_variantes = OrderedDict()
+_cache_variantes_lock = threading.Lock()
+
+
+def _texto(valor):
+    """Escapa texto vindo do usuário para uso seguro no HTML."""
+    return html.escape(str(valor or ""), quote=True)
+
+
+def _abrir_imagem_b64(imagem_b64):
+    """Decodifica uma imagem em base64 e a converte para um modo compatível com WebP."""
+    imagem = Image.open(io.BytesIO(base64.b64decode(imagem_b64)))
+    imagem.load()
+    if imagem.mode not in ("RGB", "RGBA"):
+        imagem = imagem.convert("RGBA" if "transparency" in imagem.info or imagem.mode in ("LA", "P") else "RGB")
+    return imagem
+
+
+def _recortar_proporcao(imagem, proporcao):
+    """Recorta a imagem no centro para a proporção altura/largura informada (equivale ao object-fit: cover)."""
+    largura, altura = imagem.size
+    altura_alvo = int(largura * proporcao)
+    if altura_alvo <= altura:
+        topo = (altura - altura_alvo) // 2
+        return imagem.crop((0, topo, largura, topo + altura_alvo))
+    largura_alvo = int(altura / proporcao)
+    esquerda = (largura - largura_alvo) // 2
+    return imagem.crop((esquerda, 0, esquerda + largura_alvo, altura))
+
+
+def gerar_variantes_webp(imagem, larguras):
+    """
+    Gera as variantes WebP de uma imagem PIL.
+    Retorna uma lista de tuplas (largura, altura, bytes). Nunca amplia a imagem original.
+    """
+    variantes = []
+    larguras_validas = sorted({min(w, imagem.width) for w in larguras})
+    for largura in larguras_validas:
+        altura = max(1, round(imagem.height * largura / imagem.width))
+        redimensionada = imagem if largura == imagem.width else imagem.resize((largura, altura), Image.LANCZOS)
+        buffer = io.BytesIO()
+        redimensionada.save(buffer, format="WEBP", quality=QUALIDADE_WEBP, method=6)
+        variantes.append((largura, altura, buffer.getvalue()))
+    return variantes
+
+
+def variantes_imagem_b64(imagem_b64, larguras, proporcao=None):
+    """
+    Variantes WebP de uma imagem em base64, com cache pelo conteúdo da imagem + larguras + recorte.
+    A codificação WebP (method=6) é a parte cara da exportação; só roda para imagens novas.
+    """
+    chave = (hashlib.blake2b(imagem_b64.encode("ascii", "ignore"), digest_size=16).digest(), tuple(larguras), proporcao)
+    with _cache_variantes_lock:
+        if chave in _cache_variantes:
+            _cache_variantes.move_to_end(chave)
+            return _cache_variantes[chave]
+    imagem = _abrir_imagem_b64(imagem_b64)
+    if proporcao:
+        imagem = _recortar_proporcao(imagem, proporcao)
+    variantes = gerar_variantes_webp(imagem, larguras)
+    with _cache_variantes_lock:
+        _cache_variantes[chave] = variantes
+        while len(_cache_variantes) > MAX_IMAGENS_CACHE:
+            _cache_variantes.popitem(last=False)
+    return variantes
+
+
+def minificar_html(conteudo):
+    """Minificação conservadora: remove comentários e espaços entre tags e colapsa espaços em branco."""
+    conteudo = re.sub(r"<!--(?!\[if).*?-->", "", conteudo, flags=re.S)
+    conteudo = re.sub(r">\s+<", "><", conteudo)
+    conteudo = re.sub(r"\s{2,}", " ", conteudo)
+    return conteudo.strip()
+
+
+def minificar_css(conteudo):
+    """Remove comentários e espaços desnecessários do CSS."""
+    conteudo = re.sub(r"/\*.*?\*/", "", conteudo, flags=re.S)
+    conteudo = re.sub(r"\s+", " ", conteudo)
+    conteudo = re.sub(r"\s*([{}:;,>])\s*", r"\1", conteudo)
+    return conteudo.replace(";}", "}").strip()
+
+
+def _css_critico(colors, font_family):
+    """CSS da página inteira. É pequeno o bastante para ir todo embutido no <head>."""
+    primaria = "rgb{}".format(colors['primary'])
+    secundaria = "rgb{}".format(colors['secondary'])
+    texto = "rgb{}".format(colors['text'])
+    return minificar_css(f"""
+        *, *::before, *::after {{ box-sizing: border-box; }}
+        body {{ margin: 0; font-family: '{font_family}', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif; color: #1f2937; background: #fff; line-height: 1.5; }}
+        img {{ max-width: 100%; height: auto; display: block; }}
+        header {{ background: {primaria}; color: #fff; text-align: center; padding: 2rem 1rem; }}
+        header img {{ max-height: 60px; width: auto; margin: 0 auto 1rem; }}
+        header h1 {{ font-size: 1.5rem; margin: 0; }}
+        main {{ padding: 1.5rem 1rem; max-width: 1100px; margin: 0 auto; }}
+        .grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 1rem; }}
+        .produto {{ background: {colors['bg']}; border-left: 4px solid {primaria}; border-radius: 8px; padding: 1rem; box-shadow: 0 2px 4px rgba(0,0,0,.05); }}
+        .produto img {{ width: 100%; aspect-ratio: 4 / 3; object-fit: cover; border-radius: 4px; margin-bottom: .5rem; }}
+        .produto h2 {{ color: {texto}; font-size: 1rem; margin: 0 0 .5rem; }}
+        .produto p {{ font-size: .875rem; color: #4a5568; margin: 0; }}
+        .redes {{ display: flex; flex-wrap: wrap; justify-content: center; gap: .75rem; padding: 1rem; }}
+        .redes a {{ color: {texto}; font-weight: bold; text-decoration: none; padding: .5rem 1rem; border: 2px solid {primaria}; border-radius: 999px; }}
+        .whatsapp {{ position: fixed; right: 1rem; bottom: 1rem; background: #25d366; color: #fff !important; border: 0 !important; }}
+        footer {{ background: {secundaria}; text-align: center; padding: .75rem; font-size: .75rem; color: #374151; border-top: 2px solid {primaria}; }}
+        @media (min-width: 768px) {{ header h1 {{ font-size: 2rem; }} }}
+    """)
+
+
+def _tag_img(caminho_base, variantes, alt, sizes, lazy):
+    """Monta a tag <img> com srcset das variantes WebP já gravadas em 'caminho_base-<largura>.webp'."""
+    srcset = ", ".join(f"{caminho_base}-{w}.webp {w}w" for w, _, _ in variantes)
+    largura, altura, _ = variantes[-1]
+    carregamento = 'loading="lazy" decoding="async"' if lazy else 'fetchpriority="high"'
+    return (f'<img src="{caminho_base}-{largura}.webp" srcset="{srcset}" sizes="{sizes}" '
+            f'width="{largura}" height="{altura}" alt="{_texto(alt)}" {carregamento}>')
+
+
+def _url_externa(valor):
+    """
+    Normaliza um link digitado pelo usuário: aceita só http(s) e completa 'instagram.com/loja'
+    com 'https://'. Retorna None para qualquer outra coisa (ex.: 'javascript:...').
+    """
+    # Navegadores ignoram tabs/quebras dentro do esquema ('java\tscript:'), então removemos antes de validar.
+    url = re.sub(r"[\x00-\x20\x7f]", "", valor or "")
+    if not url:
+        return None
+    if not re.match(r"^[a-zA-Z][a-zA-Z0-9+.-]*://", url):
+        if re.match(r"^[a-zA-Z][a-zA-Z0-9+.-]*:(?!\d)", url):
+            return None  # esquema sem '//' (javascript:, data:, mailto:...)
+        url = "https://" + url.lstrip("/")
+    partes = urlparse(url)
+    if partes.scheme.lower() not in ("http", "https") or "." not in (partes.hostname or ""):
+        return None
+    return url
+
+
+def _links_redes(state):
+    """Monta os links de contato/redes sociais configurados no construtor."""
+    links = []
+    redes = (("instagram", "Instagram"), ("youtube", "YouTube"), ("facebook", "Facebook"))
+    for chave, rotulo in redes:
+        url = _url_externa(state.get(chave))
+        if url:
+            links.append(f'<a href="{_texto(url)}" target="_blank" rel="noopener">{rotulo}</a>')
+    numero = re.sub(r"\D", "", state.get('whatsapp') or "")
+    if numero:
+        links.append(f'<a class="whatsapp" href="https://wa.me/{numero}" target="_blank" rel="noopener">WhatsApp</a>')
+    return "".join(links)
+
+
+def gerar_site_estatico_zip(state, colors, font_family):
+    """
+    Gera o site estático do Max Construtor como um arquivo ZIP (montado em memória) e retorna os bytes.
+    As variantes WebP vêm do cache por imagem (ver variantes_imagem_b64).
+    """
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # Logo: fica acima da dobra, então é carregada com prioridade (sem lazy).
+        logo_html = ""
+        if state.get('logo_b64'):
+            variantes = variantes_imagem_b64(state['logo_b64'], LARGURAS_LOGO)
+            for largura, _, dados in variantes:
+                # WebP já é comprimido; ZIP_STORED evita gastar CPU à toa.
+                zf.writestr(f"img/logo-{largura}.webp", dados, compress_type=zipfile.ZIP_STORED)
+            logo_html = _tag_img("img/logo", variantes, "Logo", "120px", lazy=False)
+
+        produtos_html = []
+        for i, prod in enumerate(state.get('products', [])):
+            variantes = variantes_imagem_b64(prod['photo_b64'], LARGURAS_PRODUTO, PROPORCAO_PRODUTO)
+            for largura, _, dados in variantes:
+                zf.writestr(f"img/produto-{i + 1}-{largura}.webp", dados, compress_type=zipfile.ZIP_STORED)
+            # A primeira linha do grid costuma aparecer sem rolagem no celular; o resto é lazy.
+            tag = _tag_img(f"img/produto-{i + 1}", variantes, prod['name'],
+                           "(min-width: 1100px) 340px, (min-width: 768px) 45vw, 92vw", lazy=i > 0)
+            produtos_html.append(
+                f'<article class="produto">{tag}<h2>{_texto(prod["name"])}</h2><p>{_texto(prod["desc"])}</p></article>'
+            )
+
+        redes_html = _links_redes(state)
+        pagina = f"""<!DOCTYPE html>
+            <html lang="pt-BR">
+            <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1">
+            <title>{_texto(state.get('header_pitch'))}</title>
+            <meta name="description" content="{_texto(state.get('header_pitch'))}">
+            <style>{_css_critico(colors, font_family)}</style>
+            </head>
+            <body>
+            <header>{logo_html}<h1>{_texto(state.get('header_pitch'))}</h1></header>
+            <main><div class="grid">{''.join(produtos_html)}</div></main>
+            {f'<nav class="redes">{redes_html}</nav>' if redes_html else ''}
+            <footer>{_texto(state.get('footer_text'))}</footer>
+            </body>
+            </html>"""
+        info = zipfile.ZipInfo("index.html", date_time=datetime.datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        zf.writestr(info, minificar_html(pagina))
+    return saida.getvalue()
@@ -0,0 +1,255 @@
+# ==============================================================================
+# GATEWAY COMPARTILHADO DO LLM
+# ==============================================================================
+# Fica na frente da instância única do ChatGoogleGenerativeAI (st.cache_resource),
+# que é compartilhada por todas as sessões do processo. Responsável por:
+# - Limite global de chamadas simultâneas ao provedor
+# - Token bucket por empresa (tenant), para que a rajada de um não esgote a cota de todos
+# - Filas de prioridade: chat interativo passa na frente de jobs em lote
+# - Coalescência: prompts idênticos em andamento compartilham uma única chamada
+#   (só depois de cada chamador passar pela própria cota, para não herdar o limite de outro tenant)
+# - Retentativas com backoff exponencial (com jitter) em erros transitórios
+# - Métricas de fila e tempo de espera
+import re
+import time
+import heapq
+import random
+import hashlib
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_LOTE = 1
+NOMES_PRIORIDADE = {PRIORIDADE_INTERATIVA: "interativa", PRIORIDADE_LOTE: "lote"}
+
+# Status HTTP que indicam falha transitória do provedor (vale também para o 'code' das exceções do google.api_core).
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+# Último recurso, para erros embrulhados sem tipo nem status: termos inteiros na mensagem.
+_TEXTO_TRANSITORIO = re.compile(r"\b(?:429|500|502|503|504|resource ?exhausted|service unavailable|"
+                                r"deadline exceeded|rate limit exceeded)\b", re.IGNORECASE)
+# Cota diária esgotada também chega como 429/ResourceExhausted, mas não adianta tentar de novo hoje.
+_COTA_DIARIA = re.compile(r"per ?day", re.IGNORECASE)
+
+try:
+    # Dependência do langchain-google-genai; a importação é opcional só para o gateway funcionar com outros clientes.
+    from google.api_core import exceptions as _google_exceptions
+    _TIPOS_TRANSITORIOS = (_google_exceptions.TooManyRequests, _google_exceptions.ResourceExhausted,
+                           _google_exceptions.ServiceUnavailable, _google_exceptions.DeadlineExceeded,
+                           _google_exceptions.InternalServerError, _google_exceptions.BadGateway,
+                           _google_exceptions.GatewayTimeout)
+except ImportError:
+    _TIPOS_TRANSITORIOS = ()
+_TIPOS_TRANSITORIOS += (TimeoutError, ConnectionError)
+
+
+class LimiteTaxaExcedido(RuntimeError):
+    """O tenant excedeu sua cota e a espera passaria do máximo permitido."""
+
+
+class TokenBucket:
+    """Token bucket simples: 'capacidade' permite rajadas, 'taxa' é a reposição em tokens/segundo."""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self.atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, quantidade=1.0):
+        """
+        Reserva tokens e retorna quantos segundos o chamador deve esperar antes de usá-los
+        (0 se havia saldo). O saldo pode ficar negativo: as reservas seguintes esperam mais.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+            self.atualizado_em = agora
+            self.tokens -= quantidade
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.taxa
+
+    def devolver(self, quantidade=1.0):
+        with self._lock:
+            self.tokens = min(self.capacidade, self.tokens + quantidade)
+
+
+def _status_http(erro):
+    """Status HTTP da exceção, se ela informar um ('code' do google.api_core, 'status_code' ou 'response.status_code')."""
+    for status in (getattr(erro, "status_code", None), getattr(erro, "code", None),
+                   getattr(getattr(erro, "response", None), "status_code", None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def _erro_transitorio(erro):
+    """
+    Decide se vale tentar de novo: pelo tipo da exceção ou pelo status HTTP; só sem nenhum
+    dos dois olha a mensagem (termos inteiros). Erros encadeados ('raise ... from') também são avaliados.
+    """
+    vistos = set()
+    while erro is not None and id(erro) not in vistos:
+        vistos.add(id(erro))
+        status = _status_http(erro)
+        if isinstance(erro, _TIPOS_TRANSITORIOS) or status in STATUS_TRANSITORIOS:
+            return not _COTA_DIARIA.search(str(erro))
+        if status is not None:
+            return False
+        if _TEXTO_TRANSITORIO.search(str(erro)):
+            return not _COTA_DIARIA.search(str(erro))
+        erro = erro.__cause__ or erro.__context__
+    return False
+
+
+class GatewayLLM:
+    """
+    Envolve um cliente LangChain (qualquer objeto com .invoke) e controla o acesso a ele.
+    Atributos não definidos aqui são repassados ao cliente original.
+    """
+
+    def __init__(self, llm, max_concorrencia=4, taxa_por_tenant=0.5, rajada_por_tenant=5,
+                 max_tentativas=4, atraso_base=1.0, atraso_maximo=20.0, espera_maxima_tenant=60.0):
+        self.llm = llm
+        self.max_concorrencia = max_concorrencia
+        self.taxa_por_tenant = taxa_por_tenant
+        self.rajada_por_tenant = rajada_por_tenant
+        self.max_tentativas = max_tentativas
+        self.atraso_base = atraso_base
+        self.atraso_maximo = atraso_maximo
+        self.espera_maxima_tenant = espera_maxima_tenant
+
+        self._cond = threading.Condition()
+        self._fila = []  # heap de (prioridade, sequência)
+        self._sequencia = itertools.count()
+        self._em_execucao = 0
+        self._buckets = {}
+        self._em_voo = {}
+        self._em_voo_lock = threading.Lock()
+
+        self._metricas_lock = threading.Lock()
+        self._esperas = deque(maxlen=500)
+        self._contadores = {"requisicoes": 0, "chamadas_upstream": 0, "coalescidas": 0,
+                            "retentativas": 0, "erros": 0, "limitadas": 0}
+
+    def __getattr__(self, nome):
+        # Só é chamado para atributos inexistentes no gateway (ex.: model, temperature).
+        return getattr(self.llm, nome)
+
+    # --- API pública ---
+    def invoke(self, prompt, tenant_id=None, prioridade=PRIORIDADE_INTERATIVA, **kwargs):
+        """Mesma assinatura do .invoke do LangChain, mais o tenant e a prioridade da requisição."""
+        self._contar("requisicoes")
+        inicio = time.monotonic()
+        # Admissão primeiro: cada chamador paga a própria cota. Assim um tenant com saldo nunca
+        # fica esperando (nem recebe o LimiteTaxaExcedido) por causa do bucket de outro tenant.
+        self._aguardar_cota_tenant(tenant_id or "anonimo")
+        chave = self._chave_coalescencia(prompt, prioridade, kwargs)
+        with self._em_voo_lock:
+            futuro = self._em_voo.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._em_voo[chave] = futuro
+        if not lider:
+            self._contar("coalescidas")
+            return futuro.result()
+
+        try:
+            resultado = self._executar(prompt, prioridade, kwargs, inicio)
+            futuro.set_result(resultado)
+            return resultado
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._em_voo_lock:
+                self._em_voo.pop(chave, None)
+
+    def metricas(self):
+        """Retrato atual do gateway: filas por prioridade, chamadas ativas, contadores e esperas (s)."""
+        with self._cond:
+            fila = {nome: 0 for nome in NOMES_PRIORIDADE.values()}
+            for prioridade, _ in self._fila:
+                fila[NOMES_PRIORIDADE.get(prioridade, str(prioridade))] += 1
+            em_execucao = self._em_execucao
+        with self._metricas_lock:
+            esperas = sorted(self._esperas)
+            contadores = dict(self._contadores)
+        with self._em_voo_lock:
+            em_voo = len(self._em_voo)
+        return {
+            "fila": fila,
+            "profundidade_fila": sum(fila.values()),
+            "em_execucao": em_execucao,
+            "max_concorrencia": self.max_concorrencia,
+            "em_voo": em_voo,
+            "espera_media": sum(esperas) / len(esperas) if esperas else 0.0,
+            "espera_p95": esperas[min(len(esperas) - 1, int(len(esperas) * 0.95))] if esperas else 0.0,
+            "espera_maxima": esperas[-1] if esperas else 0.0,
+            **contadores,
+        }
+
+    # --- Internos ---
+    @staticmethod
+    def _chave_coalescencia(prompt, prioridade, kwargs):
+        # A prioridade entra na chave para que uma chamada interativa não espere na fila de lote.
+        bruto = repr((prompt, prioridade, sorted(kwargs.items()))).encode("utf-8", "surrogatepass")
+        return hashlib.sha256(bruto).hexdigest()
+
+    def _contar(self, nome, quantidade=1):
+        with self._metricas_lock:
+            self._contadores[nome] += quantidade
+
+    def _aguardar_cota_tenant(self, tenant_id):
+        with self._cond:
+            bucket = self._buckets.get(tenant_id)
+            if bucket is None:
+                bucket = self._buckets[tenant_id] = TokenBucket(self.taxa_por_tenant, self.rajada_por_tenant)
+        espera = bucket.reservar()
+        if espera > self.espera_maxima_tenant:
+            bucket.devolver()
+            self._contar("limitadas")
+            raise LimiteTaxaExcedido(f"Limite de requisições ao LLM atingido para '{tenant_id}'. Tente novamente em instantes.")
+        if espera:
+            time.sleep(espera)
+
+    def _adquirir_vaga(self, prioridade):
+        """Bloqueia até haver vaga global; entre os que esperam, sai primeiro a menor prioridade e depois a ordem de chegada."""
+        with self._cond:
+            ticket = (prioridade, next(self._sequencia))
+            heapq.heappush(self._fila, ticket)
+            while self._em_execucao >= self.max_concorrencia or self._fila[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(self._fila)
+            self._em_execucao += 1
+            # Pode haver mais vagas livres: acorda o próximo da fila.
+            self._cond.notify_all()
+
+    def _liberar_vaga(self):
+        with self._cond:
+            self._em_execucao -= 1
+            self._cond.notify_all()
+
+    def _executar(self, prompt, prioridade, kwargs, inicio):
+        for tentativa in range(1, self.max_tentativas + 1):
+            self._adquirir_vaga(prioridade)
+            if tentativa == 1:
+                with self._metricas_lock:
+                    self._esperas.append(time.monotonic() - inicio)
+            try:
+                self._contar("chamadas_upstream")
+                return self.llm.invoke(prompt, **kwargs)
+            except Exception as e:
+                if tentativa == self.max_tentativas or not _erro_transitorio(e):
+                    self._contar("erros")
+                    raise
+                self._contar("retentativas")
+                erro = e
+            finally:
+                self._liberar_vaga()
+            # Backoff exponencial com "full jitter", fora da vaga para não travar os outros.
+            atraso = min(self.atraso_maximo, self.atraso_base * (2 ** (tentativa - 1)))
+            print(f"Alerta: erro transitório no LLM ({erro}). Nova tentativa em até {atraso:.1f}s.")
+            time.sleep(random.uniform(0, atraso))
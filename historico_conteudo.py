@@ -0,0 +1,272 @@
+# ==============================================================================
+# HISTÓRICO PERSISTENTE DE CONTEÚDO DE MARKETING
+# ==============================================================================
+# Guarda posts, anúncios e planos de campanha gerados, por empresa, em um banco
+# SQLite local com índice de texto completo (FTS5). O Firestore é a fonte comum
+# entre réplicas: o que é salvo localmente é enviado em lotes para
+# 'companies/{company_id}/conteudos', e cada réplica puxa incrementalmente o que
+# as outras enviaram, em páginas (cursor pelo campo 'sincronizado_em' + ID do documento).
+# - Listagem paginada por cursor (keyset), estável mesmo com dezenas de milhares de itens.
+# - Busca por termo (FTS5 + bm25), com filtros de tipo, canal e período.
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from utils import get_data_path
+
+CONTEUDO_SUBCOLLECTION = "conteudos"
+TAMANHO_PAGINA = 20
+LOTE_SINCRONIZACAO = 400  # Limite do Firestore é 500 operações por batch.
+# Sobreposição do cursor de pull, para tolerar diferença de relógio entre réplicas (duplicatas são ignoradas pelo uid).
+MARGEM_PULL = 120  # segundos
+INTERVALO_MINIMO_PULL = 30  # segundos entre consultas ao Firestore por empresa neste processo
+TAMANHO_PAGINA_PULL = 200  # documentos por página lida do Firestore
+MAX_PAGINAS_PULL = 3  # páginas por chamada; o restante da carga inicial vem nas chamadas seguintes
+
+TIPO_POST = "post"
+TIPO_ANUNCIO = "anuncio"
+TIPO_CAMPANHA = "campanha"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conteudos (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL,
+    canal TEXT,
+    topico TEXT,
+    texto TEXT NOT NULL,
+    dados TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    sincronizado INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_conteudos_data ON conteudos (criado_em DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_conteudos_tipo ON conteudos (tipo, criado_em DESC);
+CREATE INDEX IF NOT EXISTS idx_conteudos_canal ON conteudos (canal, criado_em DESC);
+CREATE INDEX IF NOT EXISTS idx_conteudos_pendentes ON conteudos (id) WHERE sincronizado = 0;
+CREATE TABLE IF NOT EXISTS cursor_pull (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    sincronizado_em REAL NOT NULL,
+    doc_id TEXT NOT NULL,
+    completo INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS conteudos_fts USING fts5 (
+    topico, texto, content='conteudos', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS conteudos_ai AFTER INSERT ON conteudos BEGIN
+    INSERT INTO conteudos_fts (rowid, topico, texto) VALUES (new.id, new.topico, new.texto);
+END;
+CREATE TRIGGER IF NOT EXISTS conteudos_ad AFTER DELETE ON conteudos BEGIN
+    INSERT INTO conteudos_fts (conteudos_fts, rowid, topico, texto) VALUES ('delete', old.id, old.topico, old.texto);
+END;
+CREATE TRIGGER IF NOT EXISTS conteudos_au AFTER UPDATE OF topico, texto ON conteudos BEGIN
+    INSERT INTO conteudos_fts (conteudos_fts, rowid, topico, texto) VALUES ('delete', old.id, old.topico, old.texto);
+    INSERT INTO conteudos_fts (rowid, topico, texto) VALUES (new.id, new.topico, new.texto);
+END;
+"""
+
+_SQL_INSERIR = ("INSERT OR IGNORE INTO conteudos (uid, tipo, canal, topico, texto, dados, criado_em, sincronizado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def _texto_pesquisavel(dados):
+    """Junta todos os campos de texto do conteúdo gerado em uma única string para o índice FTS."""
+    if isinstance(dados, dict):
+        return "\n".join(_texto_pesquisavel(v) for v in dados.values() if v)
+    if isinstance(dados, (list, tuple)):
+        return "\n".join(_texto_pesquisavel(v) for v in dados if v)
+    texto = str(dados)
+    # URLs não ajudam na busca e incham o índice.
+    return "" if texto.startswith(("http://", "https://")) else texto
+
+
+def _consulta_fts(termo):
+    """Converte o texto digitado pelo usuário em uma consulta FTS5 segura (todas as palavras, com prefixo)."""
+    palavras = [p.replace('"', '') for p in str(termo).split()]
+    return " ".join(f'"{p}"*' for p in palavras if p)
+
+
+class HistoricoConteudo:
+    """Repositório de conteúdos gerados de uma empresa."""
+
+    def __init__(self, company_id):
+        self.company_id = company_id
+        self._lock = threading.Lock()
+        self._ultimo_pull = None
+        self._conn = sqlite3.connect(get_data_path("conteudos", f"{company_id}.sqlite3"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _registro(uid, tipo, dados, canal, topico, criado_em, sincronizado):
+        return (uid, tipo, canal, topico, _texto_pesquisavel(dados),
+                json.dumps(dados, ensure_ascii=False), criado_em or time.time(), int(sincronizado))
+
+    def _inserir(self, registros):
+        """Insere vários conteúdos numa única transação (uids já existentes são ignorados)."""
+        with self._lock, self._conn:
+            self._conn.executemany(_SQL_INSERIR, registros)
+
+    def salvar(self, tipo, dados, canal=None, topico=None, criado_em=None, uid=None, sincronizado=False):
+        """Salva um conteúdo gerado. Retorna o uid (também usado como ID do documento no Firestore)."""
+        uid = uid or uuid.uuid4().hex
+        self._inserir([self._registro(uid, tipo, dados, canal, topico, criado_em, sincronizado)])
+        return uid
+
+    def _filtros(self, tipo, canal, inicio, fim):
+        """Monta as cláusulas WHERE comuns à listagem e à busca."""
+        clausulas, params = [], []
+        if tipo:
+            clausulas.append("c.tipo = ?"); params.append(tipo)
+        if canal:
+            clausulas.append("c.canal = ?"); params.append(canal)
+        if inicio is not None:
+            clausulas.append("c.criado_em >= ?"); params.append(inicio)
+        if fim is not None:
+            clausulas.append("c.criado_em < ?"); params.append(fim)
+        return clausulas, params
+
+    @staticmethod
+    def _linha_para_item(linha):
+        return {
+            "uid": linha["uid"], "tipo": linha["tipo"], "canal": linha["canal"], "topico": linha["topico"],
+            "criado_em": linha["criado_em"], "dados": json.loads(linha["dados"]),
+        }
+
+    def listar(self, tamanho=TAMANHO_PAGINA, cursor=None, tipo=None, canal=None, inicio=None, fim=None):
+        """
+        Lista os conteúdos do mais recente para o mais antigo.
+        Paginação por cursor: passe o 'proximo_cursor' retornado para obter a página seguinte.
+        Retorna (itens, proximo_cursor), com proximo_cursor=None na última página.
+        """
+        clausulas, params = self._filtros(tipo, canal, inicio, fim)
+        if cursor:
+            clausulas.append("(c.criado_em, c.id) < (?, ?)"); params.extend(cursor)
+        where = f"WHERE {' AND '.join(clausulas)}" if clausulas else ""
+        sql = f"SELECT c.* FROM conteudos c {where} ORDER BY c.criado_em DESC, c.id DESC LIMIT ?"
+        with self._lock:
+            linhas = self._conn.execute(sql, (*params, tamanho + 1)).fetchall()
+        proximo = None
+        if len(linhas) > tamanho:
+            linhas = linhas[:tamanho]
+            proximo = (linhas[-1]["criado_em"], linhas[-1]["id"])
+        return [self._linha_para_item(l) for l in linhas], proximo
+
+    def buscar(self, termo, tamanho=TAMANHO_PAGINA, pagina=0, tipo=None, canal=None, inicio=None, fim=None):
+        """
+        Busca por texto completo (tópico pesa mais que o corpo), ordenada por relevância.
+        Retorna (itens, tem_mais).
+        """
+        consulta = _consulta_fts(termo)
+        if not consulta:
+            itens, proximo = self.listar(tamanho, None, tipo, canal, inicio, fim)
+            return itens, proximo is not None
+        clausulas, params = self._filtros(tipo, canal, inicio, fim)
+        clausulas.insert(0, "conteudos_fts MATCH ?"); params.insert(0, consulta)
+        sql = (f"SELECT c.* FROM conteudos_fts JOIN conteudos c ON c.id = conteudos_fts.rowid "
+               f"WHERE {' AND '.join(clausulas)} ORDER BY bm25(conteudos_fts, 4.0, 1.0), c.criado_em DESC "
+               f"LIMIT ? OFFSET ?")
+        with self._lock:
+            linhas = self._conn.execute(sql, (*params, tamanho + 1, pagina * tamanho)).fetchall()
+        return [self._linha_para_item(l) for l in linhas[:tamanho]], len(linhas) > tamanho
+
+    def canais(self):
+        """Canais já usados pela empresa (para os filtros da interface)."""
+        with self._lock:
+            return [l[0] for l in self._conn.execute(
+                "SELECT DISTINCT canal FROM conteudos WHERE canal IS NOT NULL ORDER BY canal")]
+
+    def contar(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conteudos").fetchone()[0]
+
+    # --- Sincronização com o Firestore ---
+    def sincronizar_firestore(self, db, limite=LOTE_SINCRONIZACAO):
+        """Envia ao Firestore os conteúdos ainda não sincronizados, em um único batch. Retorna quantos foram enviados."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT * FROM conteudos WHERE sincronizado = 0 ORDER BY id LIMIT ?", (limite,)).fetchall()
+        if not linhas:
+            return 0
+        colecao = db.collection("companies").document(self.company_id).collection(CONTEUDO_SUBCOLLECTION)
+        batch = db.batch()
+        enviado_em = time.time()
+        for linha in linhas:
+            item = self._linha_para_item(linha)
+            item.pop("uid")
+            item["sincronizado_em"] = enviado_em
+            batch.set(colecao.document(linha["uid"]), item)
+        batch.commit()
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE conteudos SET sincronizado = 1 WHERE id = ?", [(l["id"],) for l in linhas])
+        return len(linhas)
+
+    def _cursor_pull(self):
+        """Retorna (sincronizado_em, doc_id, completo) do último pull, ou None se nunca houve pull."""
+        with self._lock:
+            linha = self._conn.execute("SELECT sincronizado_em, doc_id, completo FROM cursor_pull WHERE id = 1").fetchone()
+        return tuple(linha) if linha else None
+
+    def puxar_do_firestore(self, db, intervalo_minimo=INTERVALO_MINIMO_PULL,
+                           tamanho_pagina=TAMANHO_PAGINA_PULL, max_paginas=MAX_PAGINAS_PULL):
+        """
+        Traz para o banco local o que outras réplicas enviaram ao Firestore desde o último pull.
+        Lê em páginas ordenadas por (sincronizado_em, ID do documento); cada página é gravada numa
+        transação junto com o cursor, então uma interrupção não perde o que já foi lido. No máximo
+        'max_paginas' por chamada: uma réplica nova completa a carga inicial ao longo de vários reruns.
+        Consultas repetidas dentro de 'intervalo_minimo' segundos são ignoradas. Retorna quantos documentos foram lidos.
+        """
+        agora = time.monotonic()
+        if self._ultimo_pull is not None and agora - self._ultimo_pull < intervalo_minimo:
+            return 0
+        self._ultimo_pull = agora
+
+        colecao = db.collection("companies").document(self.company_id).collection(CONTEUDO_SUBCOLLECTION)
+        cursor = self._cursor_pull()
+        consulta = colecao
+        inicio = None
+        if cursor and cursor[2]:
+            # Já em dia: relê uma janela curta antes do cursor para tolerar diferença de relógio entre réplicas.
+            consulta = consulta.where("sincronizado_em", ">=", cursor[0] - MARGEM_PULL)
+        elif cursor:
+            inicio = cursor[:2]  # carga inicial em andamento: continua exatamente de onde parou
+        consulta = consulta.order_by("sincronizado_em").order_by("__name__")
+
+        total = 0
+        for _ in range(max_paginas):
+            pagina = consulta
+            if inicio:
+                pagina = pagina.start_after({"sincronizado_em": inicio[0], "__name__": colecao.document(inicio[1])})
+            docs = list(pagina.limit(tamanho_pagina).stream())
+            completo = len(docs) < tamanho_pagina
+            registros = []
+            for doc in docs:
+                item = doc.to_dict() or {}
+                registros.append(self._registro(doc.id, item.get("tipo", TIPO_POST), item.get("dados", {}),
+                                                item.get("canal"), item.get("topico"), item.get("criado_em"), True))
+            if docs:
+                inicio = (docs[-1].to_dict().get("sincronizado_em") or 0.0, docs[-1].id)
+            with self._lock, self._conn:
+                self._conn.executemany(_SQL_INSERIR, registros)
+                if inicio:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cursor_pull (id, sincronizado_em, doc_id, completo) VALUES (1, ?, ?, ?)",
+                        (inicio[0], inicio[1], int(completo)))
+            total += len(docs)
+            if completo:
+                break
+        return total
+
+
+_historicos = {}
+_historicos_lock = threading.Lock()
+
+
+def obter_historico(company_id):
+    """Retorna o repositório da empresa, reaproveitando a conexão entre reruns."""
+    with _historicos_lock:
+        if company_id not in _historicos:
+            _historicos[company_id] = HistoricoConteudo(company_id)
+        return _historicos[company_id]
@@ -0,0 +1,227 @@
+# ==============================================================================
+# ÍNDICE DE RECUPERAÇÃO LOCAL - CONHECIMENTO DE CALIBRAÇÃO DA EMPRESA
+# ==============================================================================
+# Em vez de mandar o documento inteiro da calibração em todo prompt, os agentes
+# consultam este índice e recebem apenas os trechos relevantes para a pergunta.
+# - Representação: "feature hashing" de palavras, bigramas e trigramas de caracteres,
+#   calculada localmente (funciona offline, sem modelo de embeddings externo).
+# - Busca: produto escalar em NumPy + argpartition para o top-k.
+# - Atualização incremental: só os trechos cujo conteúdo mudou são recalculados.
+# - Persistência: vetores em .npy e metadados em .json, por empresa.
+import os
+import re
+import json
+import hashlib
+import functools
+import threading
+import unicodedata
+import numpy as np
+from utils import get_data_path
+
+DIMENSAO = 2048
+VERSAO_INDICE = 1
+
+# Campos do formulário de calibração que viram conhecimento consultável.
+CAMPOS_INDEXADOS = {
+    'pitch': "Descrição do negócio",
+    'produtos': "Produtos/Serviços",
+    'diferencial': "Diferencial competitivo",
+    'faixa_preco': "Faixa de preço",
+    'cliente_ideal': "Cliente ideal",
+    'dor_cliente': "Dor do cliente",
+    'objecao_venda': "Objeção de venda",
+    'faqs': "Perguntas frequentes",
+    'valores': "Valores da marca",
+    'personalidade': "Personalidade da marca",
+    'linguagem_cliente': "Linguagem do público",
+}
+
+# Palavras muito comuns que não ajudam a diferenciar trechos.
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "e", "em", "no", "na",
+    "nos", "nas", "para", "por", "com", "que", "se", "ao", "aos", "ou", "mais", "muito", "como",
+    "qual", "quais", "sua", "seu", "suas", "seus", "nosso", "nossa", "é", "sao", "ser",
+}
+
+
+def normalizar_texto(texto):
+    """Minúsculas e sem acentos, para que 'Promoção' e 'promocao' caiam nas mesmas features."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _features(texto):
+    """Extrai as features textuais: palavras, bigramas de palavras e trigramas de caracteres."""
+    palavras = [p for p in re.findall(r"\w+", normalizar_texto(texto)) if p not in STOPWORDS]
+    features = list(palavras)
+    features += [f"{a}_{b}" for a, b in zip(palavras, palavras[1:])]
+    for palavra in palavras:
+        marcada = f"#{palavra}#"
+        features += [marcada[i:i + 3] for i in range(len(marcada) - 2)]
+    return features
+
+
+@functools.lru_cache(maxsize=65536)
+def _hash_feature(feature):
+    """Hash estável entre processos (o hash() do Python muda a cada execução)."""
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    valor = int.from_bytes(digest, "little")
+    return valor % DIMENSAO, 1.0 if (valor >> 63) else -1.0
+
+
+def vetorizar(textos):
+    """Converte uma lista de textos em uma matriz (n, DIMENSAO) float32 com linhas L2-normalizadas."""
+    matriz = np.zeros((len(textos), DIMENSAO), dtype=np.float32)
+    for linha, texto in enumerate(textos):
+        for feature in _features(texto):
+            indice, sinal = _hash_feature(feature)
+            matriz[linha, indice] += sinal
+    # TF sublinear: reduz o peso de termos repetidos sem perder o sinal.
+    np.copyto(matriz, np.sign(matriz) * np.log1p(np.abs(matriz)))
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def _hash_texto(texto):
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def dividir_em_trechos(calibration_data):
+    """
+    Divide os campos da calibração em trechos curtos (uma linha/item por trecho).
+    Retorna um dicionário {chave_trecho: texto}. A chave é o campo mais o hash do conteúdo
+    ('faqs:3f2a...'), então um trecho que só mudou de posição mantém a chave e o vetor.
+    """
+    trechos = {}
+    for campo, rotulo in CAMPOS_INDEXADOS.items():
+        valor = calibration_data.get(campo)
+        if not valor:
+            continue
+        if isinstance(valor, (list, tuple)):
+            partes = [", ".join(str(v) for v in valor)]
+        else:
+            partes = [p.strip(" -•*\t") for p in re.split(r"[\n;]+|(?<=[.?!])\s+", str(valor))]
+        for parte in partes:
+            if parte:
+                texto = f"{rotulo}: {parte}"
+                trechos[f"{campo}:{_hash_texto(texto)[:16]}"] = texto
+    return trechos
+
+
+class IndiceCalibracao:
+    """Índice vetorial de uma empresa, persistido em disco e atualizado incrementalmente."""
+
+    def __init__(self, company_id):
+        self.company_id = company_id
+        self.caminho_vetores = get_data_path("indices", str(company_id), "vetores.npy")
+        self.caminho_meta = get_data_path("indices", str(company_id), "meta.json")
+        self.chaves = []
+        self.textos = []
+        self.hashes = []
+        self.vetores = np.zeros((0, DIMENSAO), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.carregar()
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def carregar(self):
+        """Carrega o índice salvo em disco, se existir e for compatível."""
+        if not (os.path.exists(self.caminho_meta) and os.path.exists(self.caminho_vetores)):
+            return
+        try:
+            with open(self.caminho_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("versao") != VERSAO_INDICE or meta.get("dimensao") != DIMENSAO:
+                return
+            vetores = np.load(self.caminho_vetores)
+            if vetores.shape[0] != len(meta["chaves"]):
+                return
+            self.chaves, self.textos, self.hashes = meta["chaves"], meta["textos"], meta["hashes"]
+            self.vetores = vetores
+        except Exception as e:
+            print(f"Alerta: índice da empresa {self.company_id} inválido, será recriado. Erro: {e}")
+
+    def salvar(self):
+        """Grava vetores e metadados de forma atômica (arquivo temporário + rename)."""
+        meta = {"versao": VERSAO_INDICE, "dimensao": DIMENSAO,
+                "chaves": self.chaves, "textos": self.textos, "hashes": self.hashes}
+        tmp_vetores = self.caminho_vetores + ".tmp.npy"
+        tmp_meta = self.caminho_meta + ".tmp"
+        np.save(tmp_vetores, self.vetores)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_vetores, self.caminho_vetores)
+        os.replace(tmp_meta, self.caminho_meta)
+
+    def atualizar(self, calibration_data):
+        """
+        Sincroniza o índice com os dados de calibração atuais.
+        Só vetoriza trechos novos ou alterados; trechos removidos saem do índice.
+        Retorna o número de trechos recalculados.
+        """
+        trechos = dividir_em_trechos(calibration_data)
+        with self._lock:
+            existentes = {chave: (h, i) for i, (chave, h) in enumerate(zip(self.chaves, self.hashes))}
+            chaves, textos, hashes, origem, pendentes = [], [], [], [], []
+            for chave, texto in trechos.items():
+                h = _hash_texto(texto)
+                anterior = existentes.get(chave)
+                chaves.append(chave); textos.append(texto); hashes.append(h)
+                if anterior and anterior[0] == h:
+                    origem.append(anterior[1])
+                else:
+                    origem.append(-1); pendentes.append(len(chaves) - 1)
+
+            if not pendentes and chaves == self.chaves:
+                return 0
+
+            vetores = np.zeros((len(chaves), DIMENSAO), dtype=np.float32)
+            reaproveitados = [(i, o) for i, o in enumerate(origem) if o >= 0]
+            if reaproveitados:
+                destino, fonte = zip(*reaproveitados)
+                vetores[list(destino)] = self.vetores[list(fonte)]
+            if pendentes:
+                vetores[pendentes] = vetorizar([textos[i] for i in pendentes])
+
+            self.chaves, self.textos, self.hashes, self.vetores = chaves, textos, hashes, vetores
+            self.salvar()
+        return len(pendentes)
+
+    def buscar(self, consulta, k=4, score_minimo=0.05):
+        """Retorna os k trechos mais similares à consulta: lista de dicts {chave, texto, score}."""
+        vetores = self.vetores
+        if not len(vetores) or not str(consulta).strip():
+            return []
+        scores = vetores @ vetorizar([consulta])[0]
+        k = min(k, len(scores))
+        candidatos = np.argpartition(-scores, k - 1)[:k]
+        ordenados = candidatos[np.argsort(-scores[candidatos])]
+        return [{"chave": self.chaves[i], "texto": self.textos[i], "score": float(scores[i])}
+                for i in ordenados if scores[i] >= score_minimo]
+
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def obter_indice(company_id):
+    """Retorna a instância do índice da empresa, mantendo-a em memória entre reruns."""
+    with _indices_lock:
+        if company_id not in _indices:
+            _indices[company_id] = IndiceCalibracao(company_id)
+        return _indices[company_id]
+
+
+def atualizar_indice_calibracao(company_id, calibration_data):
+    """Atalho usado após salvar a calibração. Retorna o número de trechos recalculados."""
+    return obter_indice(company_id).atualizar(calibration_data)
+
+
+def montar_contexto_empresa(company_id, consulta, k=4):
+    """Monta o bloco de contexto enxuto (apenas trechos relevantes) para ir no prompt do LLM."""
+    resultados = obter_indice(company_id).buscar(consulta, k=k)
+    if not resultados:
+        return ""
+    return "Contexto da empresa:\n" + "\n".join(f"- {r['texto']}" for r in resultados)
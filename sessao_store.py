@@ -0,0 +1,442 @@
+# ==============================================================================
+# ARMAZENAMENTO EXTERNO DA SESSÃO
+# ==============================================================================
+# Tira o estado do usuário de dentro do processo do Streamlit para que qualquer
+# réplica (Cloud Run) consiga continuar a sessão, sem sticky sessions.
+# - Backends plugáveis: SQLite (um host / volume compartilhado) e Redis (protocolo
+#   RESP implementado aqui mesmo, sem dependência extra).
+# - Serialização compacta: JSON + zlib para valores grandes. Nada de pickle: quem consegue
+#   escrever no store compartilhado não pode executar código nas réplicas.
+# - Cache local das sessões quentes: a versão gravada por este processo dispensa reler o backend.
+# - Gravação incremental: uma assinatura barata de cada chave (textos grandes entram por
+#   identidade + tamanho) descarta as que não mudaram; as demais são comparadas pelo digest do
+#   JSON, e só as que mudaram de fato são comprimidas e enviadas (as removidas, apagadas).
+import json
+import time
+import hashlib
+import zlib
+import socket
+import secrets
+import sqlite3
+import threading
+from urllib.parse import urlparse
+from collections import OrderedDict
+
+# Chaves do st.session_state que sobrevivem à troca de réplica. É uma lista explícita
+# de propósito: chaves de widgets (senha do login, uploads, botões) não devem ser
+# gravadas nem restauradas, e o 'agente' é recriado a partir dos recursos em cache.
+CHAVES_PERSISTENTES_FIXAS = {
+    'user_is_authenticated', 'user_uid', 'user_email', 'company_id', 'show_login_form',
+    'construtor_state', 'calibration_data', 'messages_trainer',
+    'marketing_post_result', 'marketing_ads_result', '_uid_anterior',
+}
+TTL_SESSAO = 7 * 24 * 3600  # segundos
+INTERVALO_LIMPEZA = 3600  # segundos entre limpezas de sessões expiradas (backends sem TTL nativo)
+LIMITE_COMPRESSAO = 512  # bytes; valores menores não compensam o zlib
+
+# Textos a partir deste tamanho (ex.: imagens em base64) entram na assinatura por identidade + tamanho.
+LIMITE_TEXTO_GRANDE = 16 * 1024  # caracteres
+
+_PREFIXO_JSON = b"j"
+_PREFIXO_ZLIB = b"z"
+
+
+def _codificar(valor):
+    """JSON compacto em UTF-8. Levanta TypeError para valores que não são JSON (dict, list, str, números, None)."""
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def _digest(bruto):
+    return hashlib.blake2b(bruto, digest_size=16).digest()
+
+
+def _esqueleto(valor, grandes):
+    """
+    Cópia rasa da estrutura em que textos grandes viram uma referência (id + tamanho). Strings são
+    imutáveis, então a mesma referência garante o mesmo conteúdo enquanto o objeto estiver vivo;
+    por isso os textos referenciados são guardados em 'grandes' junto com a assinatura.
+    """
+    if isinstance(valor, str):
+        if len(valor) >= LIMITE_TEXTO_GRANDE:
+            grandes.append(valor)
+            return f"\x00{id(valor)}:{len(valor)}"
+        return valor
+    if isinstance(valor, dict):
+        return {chave: _esqueleto(v, grandes) for chave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_esqueleto(v, grandes) for v in valor]
+    return valor
+
+
+def _assinatura(valor):
+    """Assinatura barata do valor: (digest do esqueleto, textos grandes referenciados)."""
+    grandes = []
+    return _digest(_codificar(_esqueleto(valor, grandes))), grandes
+
+
+def _compactar(bruto):
+    """Comprime o JSON com zlib apenas quando vale a pena."""
+    if len(bruto) >= LIMITE_COMPRESSAO:
+        comprimido = zlib.compress(bruto, 6)
+        if len(comprimido) < len(bruto):
+            return _PREFIXO_ZLIB + comprimido
+    return _PREFIXO_JSON + bruto
+
+
+def _descompactar(dados):
+    """Devolve o JSON original de um valor gravado por _compactar."""
+    prefixo, corpo = dados[:1], dados[1:]
+    if prefixo == _PREFIXO_ZLIB:
+        return zlib.decompress(corpo)
+    if prefixo == _PREFIXO_JSON:
+        return corpo
+    raise ValueError("formato de valor desconhecido")
+
+
+def serializar(valor):
+    """Serializa um valor de forma compacta (JSON + zlib para valores grandes)."""
+    return _compactar(_codificar(valor))
+
+
+def desserializar(dados):
+    return json.loads(_descompactar(dados))
+
+
+# ==============================================================================
+# BACKENDS
+# ==============================================================================
+class BackendSessao:
+    """
+    Interface dos backends. Valores são sempre bytes já serializados.
+    A versão é um token opaco que muda a cada gravação da sessão.
+    """
+
+    def versao(self, sid):
+        raise NotImplementedError
+
+    def carregar(self, sid):
+        """Retorna (versao, {chave: bytes}); versao=None se a sessão não existir."""
+        raise NotImplementedError
+
+    def gravar(self, sid, versao, alteradas, removidas):
+        raise NotImplementedError
+
+    def apagar(self, sid):
+        raise NotImplementedError
+
+    def limpar_expiradas(self):
+        """Remove sessões vencidas. Backends com TTL nativo (Redis) não precisam fazer nada."""
+        return 0
+
+
+class BackendSQLite(BackendSessao):
+    """
+    Backend em arquivo SQLite. Serve para um único host ou para réplicas com um volume compartilhado.
+    Versão e validade ficam numa tabela pequena por sessão, para que renovar o TTL não
+    reescreva os valores grandes.
+    """
+
+    def __init__(self, caminho, ttl=TTL_SESSAO):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessoes (sid TEXT PRIMARY KEY, versao TEXT NOT NULL, expira_em REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes (expira_em);
+            CREATE TABLE IF NOT EXISTS sessao_chaves (sid TEXT NOT NULL, chave TEXT NOT NULL, valor BLOB NOT NULL,
+                                                      PRIMARY KEY (sid, chave));
+        """)
+
+    def versao(self, sid):
+        with self._lock:
+            linha = self._conn.execute("SELECT versao FROM sessoes WHERE sid = ? AND expira_em > ?",
+                                       (sid, time.time())).fetchone()
+        return linha[0] if linha else None
+
+    def carregar(self, sid):
+        with self._lock:
+            linha = self._conn.execute("SELECT versao FROM sessoes WHERE sid = ? AND expira_em > ?",
+                                       (sid, time.time())).fetchone()
+            if not linha:
+                return None, {}
+            linhas = self._conn.execute("SELECT chave, valor FROM sessao_chaves WHERE sid = ?", (sid,)).fetchall()
+        return linha[0], {chave: bytes(valor) for chave, valor in linhas}
+
+    def gravar(self, sid, versao, alteradas, removidas):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sessoes (sid, versao, expira_em) VALUES (?, ?, ?)",
+                               (sid, versao, time.time() + self.ttl))
+            self._conn.executemany("INSERT OR REPLACE INTO sessao_chaves (sid, chave, valor) VALUES (?, ?, ?)",
+                                   [(sid, chave, valor) for chave, valor in alteradas.items()])
+            if removidas:
+                self._conn.executemany("DELETE FROM sessao_chaves WHERE sid = ? AND chave = ?", [(sid, c) for c in removidas])
+
+    def apagar(self, sid):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessao_chaves WHERE sid = ?", (sid,))
+            self._conn.execute("DELETE FROM sessoes WHERE sid = ?", (sid,))
+
+    def limpar_expiradas(self):
+        with self._lock, self._conn:
+            agora = time.time()
+            self._conn.execute("DELETE FROM sessao_chaves WHERE sid IN (SELECT sid FROM sessoes WHERE expira_em <= ?)", (agora,))
+            return self._conn.execute("DELETE FROM sessoes WHERE expira_em <= ?", (agora,)).rowcount
+
+
+class ErroRedis(RuntimeError):
+    """Erro retornado pelo servidor Redis (resposta '-ERR ...')."""
+
+
+class ClienteRESP:
+    """Cliente mínimo do protocolo Redis (RESP2), com pipeline. Compatível com Redis, Valkey, KeyDB e Memorystore."""
+
+    def __init__(self, url, timeout=5.0):
+        partes = urlparse(url)
+        self.host = partes.hostname or "localhost"
+        self.porta = partes.port or 6379
+        self.senha = partes.password
+        self.usuario = partes.username
+        self.db = int(partes.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._arquivo = None
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        self._sock = socket.create_connection((self.host, self.porta), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._arquivo = self._sock.makefile("rb")
+        iniciais = []
+        if self.senha:
+            iniciais.append(("AUTH", self.usuario, self.senha) if self.usuario else ("AUTH", self.senha))
+        if self.db:
+            iniciais.append(("SELECT", self.db))
+        if iniciais:
+            self._enviar_e_ler(iniciais)
+
+    def _fechar(self):
+        for recurso in (self._arquivo, self._sock):
+            try:
+                if recurso: recurso.close()
+            except OSError:
+                pass
+        self._sock = self._arquivo = None
+
+    @staticmethod
+    def _codificar(comando):
+        partes = [b"*%d\r\n" % len(comando)]
+        for arg in comando:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            partes.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(partes)
+
+    def _ler_resposta(self):
+        linha = self._arquivo.readline()
+        if not linha:
+            raise ConnectionError("Conexão com o Redis encerrada.")
+        tipo, resto = linha[:1], linha[1:-2]
+        if tipo == b"+":
+            return resto.decode()
+        if tipo == b"-":
+            return ErroRedis(resto.decode())
+        if tipo == b":":
+            return int(resto)
+        if tipo == b"$":
+            tamanho = int(resto)
+            if tamanho < 0:
+                return None
+            dados = self._arquivo.read(tamanho + 2)
+            return dados[:-2]
+        if tipo == b"*":
+            tamanho = int(resto)
+            return None if tamanho < 0 else [self._ler_resposta() for _ in range(tamanho)]
+        raise ConnectionError(f"Resposta inesperada do Redis: {linha!r}")
+
+    def _enviar_e_ler(self, comandos):
+        self._sock.sendall(b"".join(self._codificar(c) for c in comandos))
+        respostas = [self._ler_resposta() for _ in comandos]
+        for resposta in respostas:
+            if isinstance(resposta, ErroRedis):
+                raise resposta
+        return respostas
+
+    def pipeline(self, *comandos):
+        """Envia vários comandos em uma única ida e volta. Reconecta uma vez em caso de queda."""
+        with self._lock:
+            for tentativa in range(2):
+                try:
+                    if self._sock is None:
+                        self._conectar()
+                    return self._enviar_e_ler(comandos)
+                except (ConnectionError, OSError):
+                    self._fechar()
+                    if tentativa:
+                        raise
+
+    def executar(self, *comando):
+        return self.pipeline(comando)[0]
+
+
+class BackendRedis(BackendSessao):
+    """Backend Redis: cada sessão é um HASH 'prefixo:sid' com TTL renovado a cada gravação."""
+
+    _CAMPO_VERSAO = "__versao__"
+
+    def __init__(self, url, ttl=TTL_SESSAO, prefixo="maxia:sessao"):
+        self.cliente = ClienteRESP(url)
+        self.ttl = ttl
+        self.prefixo = prefixo
+
+    def _chave(self, sid):
+        return f"{self.prefixo}:{sid}"
+
+    def versao(self, sid):
+        valor = self.cliente.executar("HGET", self._chave(sid), self._CAMPO_VERSAO)
+        return valor.decode() if valor else None
+
+    def carregar(self, sid):
+        plano = self.cliente.executar("HGETALL", self._chave(sid)) or []
+        dados = {plano[i].decode(): plano[i + 1] for i in range(0, len(plano), 2)}
+        versao = dados.pop(self._CAMPO_VERSAO, None)
+        return (versao.decode() if versao else None), dados
+
+    def gravar(self, sid, versao, alteradas, removidas):
+        chave = self._chave(sid)
+        campos = [self._CAMPO_VERSAO, versao]
+        for nome, valor in alteradas.items():
+            campos += [nome, valor]
+        comandos = [("HSET", chave, *campos)]
+        if removidas:
+            comandos.append(("HDEL", chave, *removidas))
+        comandos.append(("EXPIRE", chave, self.ttl))
+        self.cliente.pipeline(*comandos)
+
+    def apagar(self, sid):
+        self.cliente.executar("DEL", self._chave(sid))
+
+
+# ==============================================================================
+# GERENCIADOR (CACHE LOCAL + ESCRITA INCREMENTAL)
+# ==============================================================================
+class GerenciadorSessao:
+    """
+    Sincroniza um dicionário de estado (st.session_state) com o backend.
+    Mantém em memória as últimas sessões usadas: {sid: (versao, gravada_aqui, {chave: (assinatura, digest, grandes)})}.
+    """
+
+    def __init__(self, backend, chaves_persistentes, max_sessoes_cache=1000, intervalo_limpeza=INTERVALO_LIMPEZA):
+        self.backend = backend
+        self.chaves_persistentes = set(chaves_persistentes)
+        self.max_sessoes_cache = max_sessoes_cache
+        self.intervalo_limpeza = intervalo_limpeza
+        self._ultima_limpeza = time.monotonic()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _do_cache(self, sid):
+        with self._lock:
+            if sid in self._cache:
+                self._cache.move_to_end(sid)
+                return self._cache[sid]
+        return None
+
+    def _guardar_cache(self, sid, versao, gravada_aqui, chaves):
+        with self._lock:
+            self._cache[sid] = (versao, gravada_aqui, chaves)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.max_sessoes_cache:
+                self._cache.popitem(last=False)
+
+    def _limpar_se_necessario(self):
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._ultima_limpeza < self.intervalo_limpeza:
+                return
+            self._ultima_limpeza = agora
+        try:
+            self.backend.limpar_expiradas()
+        except Exception as e:
+            print(f"Alerta: falha ao limpar sessões expiradas. Erro: {e}")
+
+    def existe(self, sid):
+        """True se o sid foi emitido pelo servidor e ainda está válido no backend."""
+        return bool(sid) and self.backend.versao(sid) is not None
+
+    def hidratar(self, sid, estado):
+        """Restaura no 'estado' as chaves salvas da sessão. Chaves já presentes no estado não são sobrescritas."""
+        versao, blobs = self.backend.carregar(sid)
+        chaves = {}
+        for chave, blob in blobs.items():
+            try:
+                bruto = _descompactar(blob)
+                valor = json.loads(bruto)
+                assinatura, grandes = (None, []) if chave in estado else _assinatura(valor)
+                chaves[chave] = (assinatura, _digest(bruto), grandes)
+                if chave not in estado:
+                    estado[chave] = valor
+            except Exception as e:
+                print(f"Alerta: não foi possível restaurar '{chave}' da sessão. Erro: {e}")
+        self._guardar_cache(sid, versao, False, chaves)
+        return len(blobs)
+
+    def persistir(self, sid, estado):
+        """
+        Grava apenas as chaves persistentes que mudaram desde a última gravação/leitura.
+        Chaves com a mesma assinatura barata são puladas sem codificar; as outras são codificadas
+        e comparadas pelo digest do JSON, e o zlib roda só nas que mudaram. Sem mudanças, não há
+        nenhuma ida ao backend. Retorna quantas chaves foram gravadas ou removidas.
+        """
+        self._limpar_se_necessario()
+        versao_cache, gravada_aqui, anteriores = self._do_cache(sid) or (None, False, {})
+        atuais, alteradas = {}, {}
+        for chave in self.chaves_persistentes:
+            if chave not in estado:
+                continue
+            try:
+                assinatura, grandes = _assinatura(estado[chave])
+                anterior = anteriores.get(chave)
+                if anterior and anterior[0] == assinatura:
+                    atuais[chave] = anterior
+                    continue
+                bruto = _codificar(estado[chave])
+            except (TypeError, ValueError) as e:
+                print(f"Alerta: '{chave}' não é serializável em JSON e não será persistida. Erro: {e}")
+                continue
+            digest = _digest(bruto)
+            atuais[chave] = (assinatura, digest, grandes)
+            if not anterior or anterior[1] != digest:
+                alteradas[chave] = bruto
+        removidas = [c for c in anteriores if c not in atuais]
+        if not alteradas and not removidas:
+            # Nada a enviar; só atualiza as assinaturas (ex.: mesmo conteúdo em outro objeto).
+            self._guardar_cache(sid, versao_cache, gravada_aqui, atuais)
+            return 0
+        # Se a versão em cache veio de uma leitura, outra réplica pode ter gravado depois dela
+        # (ex.: duas abas); nesse caso o cache não serve de base e tudo é regravado.
+        if versao_cache is not None and not gravada_aqui and self.backend.versao(sid) != versao_cache:
+            alteradas = {c: _codificar(estado[c]) for c in atuais}
+            removidas = []
+        versao = secrets.token_hex(8)
+        self.backend.gravar(sid, versao, {c: _compactar(b) for c, b in alteradas.items()}, removidas)
+        self._guardar_cache(sid, versao, True, atuais)
+        return len(alteradas) + len(removidas)
+
+    def encerrar(self, sid):
+        """Apaga a sessão no backend e no cache local (logout ou rotação do sid)."""
+        self.backend.apagar(sid)
+        with self._lock:
+            self._cache.pop(sid, None)
+
+
+def criar_backend(url_backend, caminho_sqlite):
+    """'redis://[usuario:senha@]host:porta/db' usa Redis; qualquer outro valor usa o arquivo SQLite local."""
+    if url_backend and url_backend.startswith("redis://"):
+        return BackendRedis(url_backend)
+    return BackendSQLite(caminho_sqlite)
+
+
+def novo_id_sessao():
+    return secrets.token_urlsafe(24)
@@ -2,6 +2,7 @@
 # 1. IMPORTAÇÕES E CONFIGURAÇÃO INICIAL DA PÁGINA
 # ==============================================================================
 import streamlit as st
+import streamlit.components.v1 as components
 import os
 import io
 import pyrebase
@@ -16,6 +17,13 @@ from fpdf import FPDF
 from langchain_google_genai import ChatGoogleGenerativeAI
 from firebase_admin import credentials, firestore as firebase_admin_firestore
 import plotly.graph_objects as go
+from exportador_site import gerar_site_estatico_zip
+from indice_calibracao import atualizar_indice_calibracao, montar_contexto_empresa
+from expansor_palavras_chave import expandir_palavras_chave, normalizar_termo
+from gateway_llm import GatewayLLM, PRIORIDADE_INTERATIVA
+from sessao_store import GerenciadorSessao, CHAVES_PERSISTENTES_FIXAS, TTL_SESSAO, criar_backend, novo_id_sessao
+from utils import get_data_path, carregar_prompts_config
+from historico_conteudo import obter_historico, TIPO_POST, TIPO_ANUNCIO, TIPO_CAMPANHA
 
 # --- INÍCIO DA CONFIGURAÇÃO DE CAMINHOS E DIRETÓRIOS ---
 # Padroniza o diretório de assets para robustez na implantação.
@@ -47,6 +55,12 @@ st.set_page_config(page_title="Max IA Empresarial", page_icon=page_icon_obj, lay
 APP_KEY_SUFFIX = "maxia_app_v14.0_final_build"
 USER_COLLECTION = "users"
 COMPANY_COLLECTION = "companies"
+COOKIE_SESSAO = "maxia_sid"
+VALIDADE_ID_TOKEN = 3600  # segundos (validade do idToken do Firebase)
+MARGEM_RENOVACAO_TOKEN = 300  # renova o idToken quando faltar menos que isso para vencer
+# Códigos do Firebase Auth que indicam credencial inválida (qualquer outro erro é tratado como transitório).
+ERROS_CREDENCIAL_FIREBASE = ("INVALID_ID_TOKEN", "TOKEN_EXPIRED", "INVALID_REFRESH_TOKEN", "USER_NOT_FOUND",
+                             "USER_DISABLED", "MISSING_REFRESH_TOKEN", "INVALID_GRANT_TYPE", "CREDENTIAL_TOO_OLD")
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 SALES_PAGE_URL = "https://sua-pagina-de-vendas.com.br" # <-- IMPORTANTE: Substitua por sua URL real
 
@@ -63,6 +77,11 @@ def convert_image_to_base64(image_name):
         print(f"ERRO convert_image_to_base64: {e}")
     return None
 
+@st.cache_data(show_spinner=False, max_entries=8)
+def gerar_site_zip_cache(state, colors, font_family):
+    """Reaproveita o ZIP quando nada mudou; se só os textos mudaram, as imagens WebP vêm do cache do exportador."""
+    return gerar_site_estatico_zip(state, colors, font_family)
+
 # ==============================================================================
 # 4. INICIALIZAÇÃO DE SERVIÇOS E AUTENTICAÇÃO
 # ==============================================================================
@@ -87,16 +106,104 @@ def get_llm():
         else: st.error("Chave GOOGLE_API_KEY não configurada."); return None
     except Exception as e: st.error(f"Erro ao inicializar LLM: {e}"); return None
 
+@st.cache_resource
+def get_llm_gateway():
+    """Gateway único do processo na frente do LLM: concorrência global, cota por empresa, prioridade e coalescência."""
+    llm = get_llm()
+    if not llm: return None
+    return GatewayLLM(
+        llm,
+        max_concorrencia=int(st.secrets.get("LLM_MAX_CONCORRENCIA", 4)),
+        taxa_por_tenant=float(st.secrets.get("LLM_TAXA_POR_EMPRESA", 0.5)),
+        rajada_por_tenant=int(st.secrets.get("LLM_RAJADA_POR_EMPRESA", 5)),
+    )
+
+@st.cache_resource
+def get_gerenciador_sessao():
+    """Store externo da sessão. Com SESSAO_BACKEND_URL=redis://... qualquer réplica continua a sessão do usuário."""
+    backend = criar_backend(os.environ.get("SESSAO_BACKEND_URL"), get_data_path("sessoes.sqlite3"))
+    return GerenciadorSessao(backend, CHAVES_PERSISTENTES_FIXAS | {f'{APP_KEY_SUFFIX}_user_session_data'})
+
+def obter_id_sessao():
+    """
+    ID da sessão no store externo. Fica no st.session_state durante a conexão e num cookie do
+    navegador para sobreviver à troca de réplica. O sid é sempre gerado pelo servidor: um valor
+    vindo do cliente só é aceito se já existir (e estiver válido) no store; qualquer outro é trocado.
+    """
+    sid = st.session_state.get('_sessao_sid')
+    if sid: return sid
+    candidato = st.context.cookies.get(COOKIE_SESSAO)
+    try: valido = get_gerenciador_sessao().existe(candidato)
+    except Exception as e:
+        print(f"Alerta: Não foi possível validar a sessão do cookie. Erro: {e}"); valido = False
+    sid = candidato if valido else novo_id_sessao()
+    st.session_state['_sessao_sid'] = sid
+    # Versões anteriores levavam o sid na URL (?sid=...); ele não é mais aceito nem exibido.
+    if "sid" in st.query_params: del st.query_params["sid"]
+    return sid
+
+def gravar_cookie_sessao(sid):
+    """
+    Grava o sid no cookie do navegador (o Streamlit só permite ler cookies). Como é escrito via
+    JavaScript, não pode ser HttpOnly; para isso o cookie precisaria ser definido por um proxy na frente do app.
+    """
+    if st.context.cookies.get(COOKIE_SESSAO) == sid: return
+    components.html(f"""<script>
+        const seguro = window.parent.location.protocol === "https:" ? "; Secure" : "";
+        window.parent.document.cookie = "{COOKIE_SESSAO}={sid}; Path=/; Max-Age={TTL_SESSAO}; SameSite=Strict" + seguro;
+    </script>""", height=0)
+
+def rotacionar_id_sessao():
+    """Troca o sid no login (evita fixação de sessão): o estado atual passa para um sid novo e o antigo é apagado."""
+    antigo, novo = st.session_state.get('_sessao_sid'), novo_id_sessao()
+    if antigo:
+        try: get_gerenciador_sessao().encerrar(antigo)
+        except Exception as e: print(f"Alerta: Não foi possível apagar a sessão anterior. Erro: {e}")
+    st.session_state['_sessao_sid'] = st.session_state['_sessao_hidratada'] = novo
+
+def encerrar_sessao():
+    """Logout: apaga a sessão persistida, limpa o estado local e gera um novo ID de sessão."""
+    try: get_gerenciador_sessao().encerrar(obter_id_sessao())
+    except Exception as e: print(f"Alerta: Não foi possível apagar a sessão persistida. Erro: {e}")
+    st.session_state.clear()
+    st.session_state['_sessao_sid'] = st.session_state['_sessao_hidratada'] = novo_id_sessao()
+
+def _credencial_rejeitada(erro):
+    """True se o Firebase recusou o token (credencial inválida); False para falhas de rede ou do serviço."""
+    if isinstance(erro, (KeyError, IndexError)): return True
+    return any(codigo in str(erro) for codigo in ERROS_CREDENCIAL_FIREBASE)
+
+def descartar_credenciais():
+    """
+    Desloga sem apagar o trabalho da sessão: remove só as chaves de autenticação e guarda o uid,
+    para que o mesmo usuário recupere o estado ao entrar de novo (outro usuário recebe uma sessão limpa).
+    """
+    uid = st.session_state.get('user_uid')
+    for chave in (f'{APP_KEY_SUFFIX}_user_session_data', 'user_is_authenticated', 'user_uid', 'user_email', 'agente'):
+        st.session_state.pop(chave, None)
+    if uid: st.session_state['_uid_anterior'] = uid
+
 def get_current_user_status(auth_client):
     user_auth, uid, email = False, None, None; session_key = f'{APP_KEY_SUFFIX}_user_session_data'
     if session_key in st.session_state and st.session_state[session_key]:
+        creds = st.session_state[session_key]
         try:
-            account_info = auth_client.get_account_info(st.session_state[session_key]['idToken'])
+            # O idToken vale 1 hora; a sessão persistida dura bem mais. Renova antes de vencer.
+            if time.time() > creds.get('expira_em', 0) - MARGEM_RENOVACAO_TOKEN:
+                renovado = auth_client.refresh(creds['refreshToken'])
+                creds = {**creds, 'idToken': renovado['idToken'], 'refreshToken': renovado['refreshToken'],
+                         'expira_em': time.time() + VALIDADE_ID_TOKEN}
+                st.session_state[session_key] = creds
+            account_info = auth_client.get_account_info(creds['idToken'])
             user_auth = True; user_info = account_info['users'][0]
             uid = user_info['localId']; email = user_info.get('email')
             st.session_state.update({'user_is_authenticated': True, 'user_uid': uid, 'user_email': email})
-        except Exception:
-            st.session_state.clear(); user_auth = False
+        except Exception as e:
+            if not _credencial_rejeitada(e):
+                # Falha transitória (rede, Firebase fora do ar): não desloga nem mexe no estado salvo.
+                print(f"Alerta: Não foi possível verificar a autenticação. Erro: {e}")
+                st.error("Não foi possível verificar sua sessão agora. Recarregue a página em instantes."); st.stop()
+            descartar_credenciais(); user_auth = False
     return user_auth, uid, email
 
 # ==============================================================================
@@ -107,6 +214,40 @@ class MaxAgente:
         self.llm = llm_instance
         self.db = db_firestore_instance
 
+    def consultar_llm(self, prompt, prioridade=PRIORIDADE_INTERATIVA):
+        """Envia o prompt ao LLM pelo gateway, identificando a empresa para o controle de cota."""
+        tenant_id = st.session_state.get('company_id') or st.session_state.get('user_uid')
+        return self.llm.invoke(prompt, tenant_id=tenant_id, prioridade=prioridade)
+
+    def obter_contexto_empresa(self, consulta, k=4):
+        """Retorna apenas os trechos da calibração relevantes para a consulta, prontos para o prompt."""
+        company_id = st.session_state.get('company_id')
+        if not company_id:
+            return ""
+        try:
+            self._sincronizar_indice_empresa(company_id)
+            return montar_contexto_empresa(company_id, consulta, k=k)
+        except Exception as e:
+            print(f"Alerta: Falha ao consultar o índice da empresa. Erro: {e}")
+            return ""
+
+    def _sincronizar_indice_empresa(self, company_id):
+        """
+        Uma vez por sessão, alinha o índice local com o documento da empresa no Firestore.
+        Cobre réplicas novas (índice vazio) e calibrações feitas em outra instância; só os
+        trechos alterados são recalculados.
+        """
+        flag = f'indice_sincronizado_{company_id}'
+        if st.session_state.get(flag):
+            return
+        st.session_state[flag] = True
+        try:
+            company_doc = self.db.collection(COMPANY_COLLECTION).document(company_id).get()
+            if company_doc.exists:
+                atualizar_indice_calibracao(company_id, company_doc.to_dict() or {})
+        except Exception as e:
+            print(f"Alerta: Não foi possível sincronizar o índice com o Firestore. Erro: {e}")
+
         # --- NOVO: Função de Onboarding e Calibração ---
     def exibir_onboarding_calibracao(self):
         st.title("Checklist de Calibração – Max IA Empresarial ⚙️")
@@ -156,13 +297,24 @@ class MaxAgente:
                 with st.spinner("Salvando o DNA da sua empresa e calibrando seus agentes de IA..."):
                     try:
                         user_uid = st.session_state.get('user_uid')
-                        company_ref = self.db.collection(COMPANY_COLLECTION).document()
-                        # Salva os dados da empresa
-                        company_ref.set(st.session_state.calibration_data)
-                        
-                        # Atualiza o documento do usuário com o ID da nova empresa
-                        user_ref = self.db.collection(USER_COLLECTION).document(user_uid)
-                        user_ref.update({"company_id": company_ref.id})
+                        company_id = st.session_state.get('company_id')
+                        if company_id:
+                            # Recalibração: atualiza a mesma empresa (mantém índice e histórico de conteúdo).
+                            company_ref = self.db.collection(COMPANY_COLLECTION).document(company_id)
+                            company_ref.set(st.session_state.calibration_data, merge=True)
+                        else:
+                            # Primeira calibração: cria a empresa e a vincula ao usuário.
+                            company_ref = self.db.collection(COMPANY_COLLECTION).document()
+                            company_ref.set(st.session_state.calibration_data)
+                            user_ref = self.db.collection(USER_COLLECTION).document(user_uid)
+                            user_ref.update({"company_id": company_ref.id})
+                            st.session_state['company_id'] = company_ref.id
+
+                        # Indexa o conhecimento da empresa para consultas locais dos agentes
+                        try:
+                            atualizar_indice_calibracao(company_ref.id, st.session_state.calibration_data)
+                        except Exception as e:
+                            print(f"Alerta: Não foi possível indexar a calibração. Erro: {e}")
 
                         time.sleep(2)
                         st.success("Calibração concluída! Seus agentes agora conhecem o seu negócio.")
@@ -226,8 +378,26 @@ class MaxAgente:
             st.session_state.messages_trainer.append({"role": "user", "content": prompt})
             with st.chat_message("user"): st.markdown(prompt)
             with st.chat_message("assistant"):
-                st.markdown(f"Explicando '{prompt}' com uma analogia de Futebol... (Simulação)")
-                st.session_state.messages_trainer.append({"role": "assistant", "content": f"Explicando '{prompt}' com uma analogia de Futebol... (Simulação)"})
+                with st.spinner("Max está pensando..."):
+                    resposta = self._responder_trainer(prompt)
+                st.markdown(resposta)
+                st.session_state.messages_trainer.append({"role": "assistant", "content": resposta})
+
+    def _responder_trainer(self, pergunta):
+        """Monta o prompt do MaxTrainer só com os trechos da calibração relevantes para a pergunta."""
+        config = carregar_prompts_config() or {}
+        system_prompt = config.get('mestre', {}).get('system_prompt', "")
+        contexto = self.obter_contexto_empresa(pergunta)
+        texto_prompt = (f"{system_prompt}\n\n"
+                        "Você está atuando como MaxTrainer IA, mentor do empreendedor. Explique o tema de forma "
+                        "simples e prática, com uma analogia do dia a dia e exemplos aplicados ao negócio dele.\n\n"
+                        f"{contexto}\n\n**Pergunta do empreendedor:** {pergunta}")
+        try:
+            resposta = self.consultar_llm(texto_prompt)
+            return getattr(resposta, 'content', str(resposta))
+        except Exception as e:
+            print(f"ERRO MaxTrainer: {e}")
+            return "Desculpe, não consegui responder agora. Tente novamente em instantes."
 
                # --- 5.1: MaxMarketing Total ---
     def exibir_max_marketing_total(self):
@@ -235,9 +405,6 @@ class MaxAgente:
         st.caption("Seu Diretor de Marketing Pessoal para criar posts, campanhas e anúncios que vendem.")
         st.markdown("---")
         
-        # Inicializa o histórico de posts na sessão, se não existir
-        if 'marketing_post_history' not in st.session_state:
-            st.session_state.marketing_post_history = []
         if 'marketing_post_result' not in st.session_state:
             st.session_state.marketing_post_result = None
 
@@ -273,6 +440,7 @@ class MaxAgente:
                                 "image_url": "https://images.pexels.com/photos/1640777/pexels-photo-1640777.jpeg?auto=compress&cs=tinysrgb&w=1260&h=750&dpr=1",
                                 "image_caption": f"Imagem gerada por IA: 'Um delicioso e convidativo {topic} servido em uma mesa de restaurante'."
                             }
+                            self._registrar_conteudo(TIPO_POST, st.session_state.marketing_post_result, canal=post_channel, topico=topic)
                         st.rerun() # Recarrega para mostrar o resultado
             
             # Exibe o resultado se ele existir no session_state
@@ -298,28 +466,13 @@ class MaxAgente:
                     st.image(result['image_url'], caption=result['image_caption'])
                 
                 if st.button("✨ Criar Novo Post"):
-                    # Adiciona o post atual ao início do histórico
-                    st.session_state.marketing_post_history.insert(0, st.session_state.marketing_post_result)
-                    # Mantém o histórico com no máximo 5 itens
-                    st.session_state.marketing_post_history = st.session_state.marketing_post_history[:5]
-                    # Limpa o resultado atual para mostrar o formulário novamente
+                    # O post já foi salvo no histórico ao ser gerado; só limpa o resultado atual
                     st.session_state.marketing_post_result = None
                     st.rerun()
 
-            # Exibe o histórico de posts
-            if st.session_state.marketing_post_history:
-                st.markdown("---")
-                st.subheader("📖 Histórico de Posts Recentes")
-                for i, post in enumerate(st.session_state.marketing_post_history):
-                    with st.container(border=True):
-                        col1, col2 = st.columns([4,1])
-                        with col1:
-                            st.write(f"**Tópico:** {post['topic']}")
-                            st.caption(f"*" + post['feed_option_1'][:50] + "...*")
-                        with col2:
-                            if st.button("Rever este Post", key=f"rever_{i}"):
-                                st.session_state.marketing_post_result = post
-                                st.rerun()
+            # Exibe o histórico persistente de conteúdos
+            st.markdown("---")
+            self._exibir_historico_conteudo()
 
        # --- Aba 2: Criar Campanha ---
         with tab_campaign:
@@ -347,6 +500,11 @@ class MaxAgente:
                         - **30% (R$ {campaign_budget*0.3:.2f}) na Rede de Pesquisa do Google:** Para capturar quem busca ativamente por você.
                         """)
                         
+                        self._registrar_conteudo(TIPO_CAMPANHA, {
+                            "objetivo": campaign_objective, "orcamento": campaign_budget, "dias": campaign_duration,
+                            "canais": {"Instagram/Facebook": round(campaign_budget * 0.7, 2), "Google Pesquisa": round(campaign_budget * 0.3, 2)},
+                        }, canal="Campanha", topico=campaign_objective)
+
                         st.success("""
                         **Definição de Público Simplificada (IA):**
                         Vou mostrar seus anúncios para:
@@ -370,16 +528,21 @@ class MaxAgente:
                             time.sleep(2)
                             # Simula a geração de conteúdo dinâmico
                             main_keyword = " ".join(user_search_term.split(" ")[:3]) # Pega as primeiras 3 palavras para o título
+                            # Expande o termo em variações ranqueadas (intenção, localização e sinônimos)
+                            keywords_scores = [k for k in expandir_palavras_chave(user_search_term, limite=15)
+                                               if k['palavra_chave'] != normalizar_termo(user_search_term)]
 
                             st.session_state.marketing_ads_result = {
                                 "term": user_search_term,
-                                "keywords": [user_search_term, f"{main_keyword} perto de mim", f"melhor {main_keyword}"],
+                                "keywords": [user_search_term] + [k['palavra_chave'] for k in keywords_scores],
+                                "keywords_scores": keywords_scores,
                                 "ad1_title": f"{main_keyword.title()} | Sabor e Tradição",
                                 "ad1_desc": "A verdadeira comida mineira que você ama. Pratos autênticos e ambiente acolhedor. Faça sua reserva!",
                                 "ad2_title": f"Onde Comer {main_keyword.title()}? | Venha nos Visitar",
                                 "ad2_desc": "Experimente o melhor da culinária local. Ingredientes frescos e receitas de família. Esperamos por você!",
                                 "optimization_tip": f"O anúncio com o título '{main_keyword.title()} | Sabor e Tradição' está com mais cliques. Recomendo pausar o outro. Você aprova?"
                             }
+                            self._registrar_conteudo(TIPO_ANUNCIO, st.session_state.marketing_ads_result, canal="Google Ads", topico=user_search_term)
                         st.rerun()
 
             # Exibe o resultado se ele existir no session_state
@@ -388,7 +551,12 @@ class MaxAgente:
                 st.subheader(f"✅ Seus Anúncios para o Google sobre '{result['term']}'")
                 
                 with st.expander("Palavras-Chave Encontradas pela IA"):
-                    st.write(result['keywords'])
+                    if result.get('keywords_scores'):
+                        st.dataframe(pd.DataFrame(result['keywords_scores']).rename(columns={
+                            'palavra_chave': "Palavra-chave", 'score': "Pontuação", 'intencao': "Intenção"}),
+                            hide_index=True, use_container_width=True)
+                    else:
+                        st.write(result['keywords'])
                 
                 with st.container(border=True):
                     st.write("**Anúncio 1 (Foco em Tradição):**")
@@ -408,6 +576,103 @@ class MaxAgente:
                     st.session_state.marketing_ads_result = None
                     st.rerun()
 
+        # --- 5.1.1: Histórico Persistente de Conteúdo ---
+    def _obter_historico_conteudo(self):
+        """
+        Retorna o histórico da empresa já com o que outras réplicas enviaram ao Firestore.
+        Sem empresa calibrada (sem company_id) não há histórico: retorna None.
+        """
+        company_id = st.session_state.get('company_id')
+        if not company_id:
+            return None
+        historico = obter_historico(company_id)
+        try:
+            historico.puxar_do_firestore(self.db)
+        except Exception as e:
+            print(f"Alerta: Não foi possível atualizar o histórico a partir do Firestore. Erro: {e}")
+        return historico
+
+    def _registrar_conteudo(self, tipo, dados, canal=None, topico=None):
+        """Salva o conteúdo gerado no histórico local e envia os pendentes ao Firestore."""
+        try:
+            historico = self._obter_historico_conteudo()
+            if historico is None:
+                return
+            historico.salvar(tipo, dados, canal=canal, topico=topico)
+            historico.sincronizar_firestore(self.db)
+        except Exception as e:
+            print(f"Alerta: Não foi possível salvar o conteúdo no histórico. Erro: {e}")
+
+    def _exibir_historico_conteudo(self):
+        historico = self._obter_historico_conteudo()
+        if historico is None:
+            st.caption("Conclua a Calibração da Empresa para guardar e pesquisar o histórico dos seus conteúdos.")
+            return
+        if historico.contar() == 0:
+            return
+        st.subheader("📖 Histórico de Conteúdos")
+
+        tipos = {"Todos": None, "Posts": TIPO_POST, "Anúncios": TIPO_ANUNCIO, "Campanhas": TIPO_CAMPANHA}
+        c1, c2, c3, c4 = st.columns([2, 1, 1, 1.5])
+        termo = c1.text_input("Buscar por tema ou palavra", key="historico_termo", placeholder="Ex: feijoada, promoção...")
+        tipo = tipos[c2.selectbox("Tipo", list(tipos.keys()), key="historico_tipo")]
+        canal = c3.selectbox("Canal", ["Todos"] + historico.canais(), key="historico_canal")
+        periodo = c4.date_input("Período", value=(), key="historico_periodo", format="DD/MM/YYYY")
+
+        filtros = {"tipo": tipo, "canal": None if canal == "Todos" else canal, "inicio": None, "fim": None}
+        if len(periodo) == 2:
+            filtros["inicio"] = time.mktime(periodo[0].timetuple())
+            filtros["fim"] = time.mktime((periodo[1] + datetime.timedelta(days=1)).timetuple())
+
+        # Volta para a primeira página sempre que a busca ou os filtros mudam
+        assinatura = (termo, tuple(filtros.items()))
+        if st.session_state.get('historico_assinatura') != assinatura:
+            st.session_state.historico_assinatura = assinatura
+            st.session_state.historico_pagina = 0
+            st.session_state.historico_cursores = [None]
+        pagina = st.session_state.historico_pagina
+
+        if termo.strip():
+            itens, tem_mais = historico.buscar(termo, pagina=pagina, **filtros)
+        else:
+            cursores = st.session_state.historico_cursores
+            itens, proximo = historico.listar(cursor=cursores[pagina], **filtros)
+            tem_mais = proximo is not None
+            if tem_mais and len(cursores) == pagina + 1:
+                cursores.append(proximo)
+
+        if not itens:
+            st.info("Nenhum conteúdo encontrado com esses filtros.")
+        for item in itens:
+            dados = item['dados']
+            with st.container(border=True):
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    data_txt = datetime.datetime.fromtimestamp(item['criado_em']).strftime("%d/%m/%Y %H:%M")
+                    st.write(f"**{item['topico'] or 'Sem tópico'}** · {item['canal'] or '-'} · {data_txt}")
+                    if item['tipo'] == TIPO_POST:
+                        st.caption("*" + dados.get('feed_option_1', '')[:80] + "...*")
+                    elif item['tipo'] == TIPO_ANUNCIO:
+                        st.caption(f"*{dados.get('ad1_title', '')}*")
+                    else:
+                        st.caption(f"Orçamento R$ {dados.get('orcamento', 0):.2f} por {dados.get('dias', 0)} dias")
+                with col2:
+                    if item['tipo'] == TIPO_POST and st.button("Rever este Post", key=f"rever_{item['uid']}"):
+                        st.session_state.marketing_post_result = dados
+                        st.rerun()
+                    elif item['tipo'] == TIPO_ANUNCIO and st.button("Rever Anúncios", key=f"rever_{item['uid']}"):
+                        st.session_state.marketing_ads_result = dados
+                        st.rerun()
+
+        nav1, nav2, nav3 = st.columns([1, 2, 1])
+        if pagina > 0 and nav1.button("⬅️ Anteriores", key="historico_anterior"):
+            st.session_state.historico_pagina -= 1
+            st.rerun()
+        nav2.caption(f"Página {pagina + 1}")
+        if tem_mais and nav3.button("Mais antigos ➡️", key="historico_proxima"):
+            st.session_state.historico_pagina += 1
+            st.rerun()
+
         # --- 5.2: Max Construtor - Página de Venda ---
     def exibir_max_construtor(self):
         st.header("🏗️ Max Construtor")
@@ -571,9 +836,19 @@ class MaxAgente:
                 mime="application/pdf", use_container_width=True
             )
 
+            # --- Exportação do Site Estático (ZIP) ---
+            try:
+                site_zip = gerar_site_zip_cache(state, colors, font_family)
+                st.download_button(
+                    label="🌐 Baixar Site Pronto (ZIP)", data=site_zip, file_name="minha_pagina_de_vendas.zip",
+                    mime="application/zip", use_container_width=True,
+                    help="Página HTML otimizada para celular, com imagens WebP leves. É só publicar o conteúdo do ZIP na sua hospedagem."
+                )
+            except Exception as e:
+                st.error(f"Não foi possível gerar o site para download: {e}")
+
 
     # Onboarding
-    def exibir_onboarding_calibracao(self): st.title("Calibração da Empresa...")
     def exibir_onboarding_trainer(self): st.title("Personalização da Experiência...")
     def exibir_tour_guiado(self): st.title("Tour Guiado...")
 
@@ -633,6 +908,12 @@ def exibir_formularios_de_acesso():
                 if st.form_submit_button("Entrar", use_container_width=True):
                     try:
                         user_creds = pb_auth_client.sign_in_with_email_and_password(email, password)
+                        user_creds['expira_em'] = time.time() + int(user_creds.get('expiresIn', VALIDADE_ID_TOKEN))
+                        # Trabalho deixado por uma sessão anterior só é mantido se for do mesmo usuário.
+                        if st.session_state.get('_uid_anterior') != user_creds.get('localId'):
+                            for chave in CHAVES_PERSISTENTES_FIXAS: st.session_state.pop(chave, None)
+                        st.session_state.pop('_uid_anterior', None)
+                        rotacionar_id_sessao()
                         st.session_state[f'{APP_KEY_SUFFIX}_user_session_data'] = user_creds
                         st.session_state['show_login_form'] = False
                         st.rerun()
@@ -658,6 +939,22 @@ def exibir_formularios_de_acesso():
 # 7. ESTRUTURA PRINCIPAL E EXECUÇÃO DO APP (VERSÃO ESTÁVEL)
 # ==============================================================================
 def main():
+    # Restaura o estado salvo no store externo (uma vez por sessão do Streamlit) e,
+    # ao fim de cada execução (inclusive em st.rerun/st.stop), grava só o que mudou.
+    gerenciador, sid = get_gerenciador_sessao(), obter_id_sessao()
+    if st.session_state.get('_sessao_hidratada') != sid:
+        try: gerenciador.hidratar(sid, st.session_state)
+        except Exception as e: print(f"Alerta: Não foi possível restaurar a sessão. Erro: {e}")
+        st.session_state['_sessao_hidratada'] = sid
+    gravar_cookie_sessao(sid)
+    try:
+        executar_app()
+    finally:
+        # O sid pode ter mudado nesta execução (login ou logout).
+        try: gerenciador.persistir(obter_id_sessao(), st.session_state)
+        except Exception as e: print(f"Alerta: Não foi possível salvar a sessão. Erro: {e}")
+
+def executar_app():
     if not all([pb_auth_client, firestore_db]):
         st.error("Falha crítica na inicialização dos serviços."); st.stop()
 
@@ -676,7 +973,7 @@ def main():
         st.sidebar.markdown("---")
         
         if 'agente' not in st.session_state:
-            llm = get_llm()
+            llm = get_llm_gateway()
             if llm and firestore_db: 
                 st.session_state.agente = MaxAgente(llm, firestore_db)
             else: 
@@ -694,10 +991,19 @@ def main():
             user_data = {"email": user_email, "access_level": 2}
             firestore_db.collection(USER_COLLECTION).document(user_uid).set(user_data, merge=True)
         
+        if user_data.get('company_id'):
+            st.session_state['company_id'] = user_data['company_id']
+
         st.sidebar.write(f"Logado como: **{user_email}**")
         st.sidebar.caption(f"Nível de Acesso: {user_data.get('access_level', 'N/D')}")
+        if user_data.get('access_level') == 1 and hasattr(agente.llm, 'metricas'):
+            with st.sidebar.expander("📊 Gateway do LLM"):
+                metricas = agente.llm.metricas()
+                st.caption(f"Fila: {metricas['profundidade_fila']} (interativa {metricas['fila']['interativa']}, lote {metricas['fila']['lote']})")
+                st.caption(f"Em execução: {metricas['em_execucao']}/{metricas['max_concorrencia']} · Coalescidas: {metricas['coalescidas']}")
+                st.caption(f"Espera média: {metricas['espera_media']:.2f}s · p95: {metricas['espera_p95']:.2f}s · Retentativas: {metricas['retentativas']}")
         if st.sidebar.button("Logout", key=f"{APP_KEY_SUFFIX}_logout"):
-            st.session_state.clear(); st.rerun()
+            encerrar_sessao(); st.rerun()
         
         # --- LÓGICA DE ACESSO POR NÍVEL ---
         opcoes_menu_completo = {
@@ -708,6 +1014,7 @@ def main():
             "🚀 MaxMarketing Total": agente.exibir_max_marketing_total,
             "🎓 MaxTrainer IA": agente.exibir_max_trainer_ia,
             "🏗️ MaxConstrutor": agente.exibir_max_construtor,
+            "⚙️ Calibração da Empresa": agente.exibir_onboarding_calibracao,
         }
         
         access_level = user_data.get('access_level', 2)
@@ -716,7 +1023,7 @@ def main():
         if access_level == 1:
             opcoes_permitidas_nomes = list(opcoes_menu_completo.keys())
         else:
-            opcoes_permitidas_nomes = ["👋 Bem-vindo", "🎓 MaxTrainer IA"]
+            opcoes_permitidas_nomes = ["👋 Bem-vindo", "🎓 MaxTrainer IA", "⚙️ Calibração da Empresa"]
             if access_level == 2: opcoes_permitidas_nomes.append("📈 Central do Cliente 360°")
             elif access_level == 3: opcoes_permitidas_nomes.append("🚀 MaxMarketing Total")
             elif access_level == 4: opcoes_permitidas_nomes.append("🏗️ MaxConstrutor")
@@ -0,0 +1,199 @@
+import time
+import threading
+
+import pytest
+
+from gateway_llm import GatewayLLM, LimiteTaxaExcedido, PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE, _erro_transitorio
+
+
+class _ErroHTTP(Exception):
+    def __init__(self, mensagem, code=None):
+        super().__init__(mensagem)
+        self.code = code
+
+
+class _LLMFalso:
+    """Cliente com .invoke controlável: registra as chamadas e pode bloquear ou falhar sob demanda."""
+
+    def __init__(self, respostas=None):
+        self.chamadas = []
+        self.liberar = threading.Event()
+        self.liberar.set()
+        self.respostas = list(respostas or [])
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt, **kwargs):
+        with self._lock:
+            self.chamadas.append(prompt)
+            resposta = self.respostas.pop(0) if self.respostas else f"resposta: {prompt}"
+        self.liberar.wait(5)
+        if isinstance(resposta, BaseException):
+            raise resposta
+        return resposta
+
+
+def _esperar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida a tempo"
+        time.sleep(0.005)
+
+
+def _em_thread(funcao, *args, **kwargs):
+    resultado = {}
+
+    def alvo():
+        try:
+            resultado["valor"] = funcao(*args, **kwargs)
+        except BaseException as e:
+            resultado["erro"] = e
+
+    thread = threading.Thread(target=alvo, daemon=True)
+    thread.start()
+    return thread, resultado
+
+
+# ==============================================================================
+# COALESCÊNCIA
+# ==============================================================================
+def test_prompts_iguais_em_andamento_fazem_uma_chamada():
+    llm = _LLMFalso()
+    llm.liberar.clear()
+    gateway = GatewayLLM(llm)
+    lider, r_lider = _em_thread(gateway.invoke, "oi", tenant_id="a")
+    _esperar(lambda: llm.chamadas)
+    seguidor, r_seguidor = _em_thread(gateway.invoke, "oi", tenant_id="b")
+    _esperar(lambda: gateway.metricas()["coalescidas"] == 1)
+    llm.liberar.set()
+    lider.join(5); seguidor.join(5)
+
+    assert r_lider["valor"] == r_seguidor["valor"] == "resposta: oi"
+    assert llm.chamadas == ["oi"]
+    metricas = gateway.metricas()
+    assert metricas["requisicoes"] == 2 and metricas["chamadas_upstream"] == 1 and metricas["em_voo"] == 0
+
+
+def test_erro_do_lider_chega_ao_seguidor():
+    llm = _LLMFalso([_ErroHTTP("400 prompt inválido", code=400)])
+    llm.liberar.clear()
+    gateway = GatewayLLM(llm)
+    lider, r_lider = _em_thread(gateway.invoke, "oi")
+    _esperar(lambda: llm.chamadas)
+    seguidor, r_seguidor = _em_thread(gateway.invoke, "oi")
+    _esperar(lambda: gateway.metricas()["coalescidas"] == 1)
+    llm.liberar.set()
+    lider.join(5); seguidor.join(5)
+
+    assert isinstance(r_lider["erro"], _ErroHTTP) and r_seguidor["erro"] is r_lider["erro"]
+    # Terminada a chamada, o mesmo prompt volta a ir ao provedor.
+    assert gateway.invoke("oi") == "resposta: oi"
+    assert llm.chamadas == ["oi", "oi"]
+
+
+def test_prioridades_diferentes_nao_coalescem():
+    llm = _LLMFalso()
+    gateway = GatewayLLM(llm)
+    gateway.invoke("oi", prioridade=PRIORIDADE_INTERATIVA)
+    gateway.invoke("oi", prioridade=PRIORIDADE_LOTE)
+    assert len(llm.chamadas) == 2
+
+
+# ==============================================================================
+# FILA DE PRIORIDADE
+# ==============================================================================
+def test_interativa_passa_na_frente_do_lote():
+    llm = _LLMFalso()
+    llm.liberar.clear()
+    gateway = GatewayLLM(llm, max_concorrencia=1)
+    ocupando, _ = _em_thread(gateway.invoke, "ocupa")
+    _esperar(lambda: llm.chamadas)
+    lote, _ = _em_thread(gateway.invoke, "lote", prioridade=PRIORIDADE_LOTE)
+    _esperar(lambda: gateway.metricas()["fila"]["lote"] == 1)
+    interativa, _ = _em_thread(gateway.invoke, "interativa", prioridade=PRIORIDADE_INTERATIVA)
+    _esperar(lambda: gateway.metricas()["profundidade_fila"] == 2)
+    llm.liberar.set()
+    for thread in (ocupando, lote, interativa):
+        thread.join(5)
+
+    assert llm.chamadas == ["ocupa", "interativa", "lote"]
+    assert gateway.metricas()["em_execucao"] == 0
+
+
+# ==============================================================================
+# COTA POR TENANT
+# ==============================================================================
+def test_limite_por_tenant_nao_afeta_outros_tenants():
+    llm = _LLMFalso()
+    gateway = GatewayLLM(llm, taxa_por_tenant=0.01, rajada_por_tenant=1, espera_maxima_tenant=0.5)
+    gateway.invoke("p1", tenant_id="a")
+    with pytest.raises(LimiteTaxaExcedido):
+        gateway.invoke("p2", tenant_id="a")
+    assert gateway.invoke("p3", tenant_id="b") == "resposta: p3"
+    assert gateway.metricas()["limitadas"] == 1
+    assert llm.chamadas == ["p1", "p3"]
+
+
+def test_tenant_limitado_nao_pega_carona_na_chamada_de_outro():
+    llm = _LLMFalso()
+    llm.liberar.clear()
+    gateway = GatewayLLM(llm, taxa_por_tenant=0.01, rajada_por_tenant=1, espera_maxima_tenant=0.5)
+    gateway._aguardar_cota_tenant("a")  # esgota a rajada do tenant 'a'
+    lider, _ = _em_thread(gateway.invoke, "oi", tenant_id="b")
+    _esperar(lambda: llm.chamadas)
+    with pytest.raises(LimiteTaxaExcedido):
+        gateway.invoke("oi", tenant_id="a")
+    llm.liberar.set()
+    lider.join(5)
+    assert gateway.metricas()["coalescidas"] == 0
+
+
+# ==============================================================================
+# RETENTATIVAS
+# ==============================================================================
+def test_retenta_erros_transitorios_e_conta():
+    llm = _LLMFalso([_ErroHTTP("indisponível", code=503), TimeoutError("lento"), "ok"])
+    gateway = GatewayLLM(llm, atraso_base=0.0)
+    assert gateway.invoke("oi") == "ok"
+    metricas = gateway.metricas()
+    assert metricas["retentativas"] == 2 and metricas["chamadas_upstream"] == 3 and metricas["erros"] == 0
+
+
+def test_nao_retenta_erro_do_cliente():
+    llm = _LLMFalso([_ErroHTTP("400 InvalidArgument: limite de 1500 tokens, timeout inválido", code=400)])
+    gateway = GatewayLLM(llm, atraso_base=0.0)
+    with pytest.raises(_ErroHTTP):
+        gateway.invoke("oi")
+    metricas = gateway.metricas()
+    assert metricas["retentativas"] == 0 and metricas["chamadas_upstream"] == 1 and metricas["erros"] == 1
+
+
+def test_desiste_apos_max_tentativas():
+    llm = _LLMFalso([_ErroHTTP("x", code=500)] * 5)
+    gateway = GatewayLLM(llm, max_tentativas=3, atraso_base=0.0)
+    with pytest.raises(_ErroHTTP):
+        gateway.invoke("oi")
+    metricas = gateway.metricas()
+    assert metricas["chamadas_upstream"] == 3 and metricas["retentativas"] == 2 and metricas["erros"] == 1
+
+
+@pytest.mark.parametrize("erro, esperado", [
+    (_ErroHTTP("boom", code=429), True),
+    (_ErroHTTP("boom", code=503), True),
+    (_ErroHTTP("timeout de 1500 ms no parâmetro", code=400), False),
+    (_ErroHTTP("429 Quota exceeded: GenerateRequestsPerDayPerProjectPerModel", code=429), False),
+    (ConnectionError("reset"), True),
+    (ValueError("1500 tokens, timeout"), False),
+    (RuntimeError("503 Service Unavailable"), True),
+])
+def test_classificacao_de_erros(erro, esperado):
+    assert _erro_transitorio(erro) is esperado
+
+
+def test_classifica_pela_causa_encadeada():
+    try:
+        try:
+            raise _ErroHTTP("limite", code=429)
+        except _ErroHTTP as causa:
+            raise RuntimeError("falha ao chamar o modelo") from causa
+    except RuntimeError as erro:
+        assert _erro_transitorio(erro)
@@ -0,0 +1,354 @@
+import time
+import pickle
+import socket
+import threading
+import socketserver
+
+import pytest
+
+import sessao_store
+from sessao_store import (BackendRedis, BackendSQLite, ClienteRESP, ErroRedis, GerenciadorSessao,
+                          desserializar, serializar)
+
+
+# ==============================================================================
+# SERVIDOR RESP FALSO (em processo)
+# ==============================================================================
+class _ServidorRESP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, senha=None):
+        super().__init__(("127.0.0.1", 0), _HandlerRESP)
+        self.senha = senha
+        self.bancos = {}  # {db: {chave: {campo: valor}}}
+        self.ttls = {}
+        self.comandos = []
+        self.conexoes = 0
+        self._sockets = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, porta = self.server_address
+        return f"redis://{host}:{porta}"
+
+    def derrubar_conexoes(self):
+        """Simula o servidor fechando as conexões abertas (reinício, timeout de ociosidade)."""
+        with self._lock:
+            for sock in self._sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._sockets.clear()
+
+
+class _HandlerRESP(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.conexoes += 1
+            self.server._sockets.append(self.request)
+        self.autenticado = self.server.senha is None
+        self.db = 0
+
+    def _ler_comando(self):
+        linha = self.rfile.readline()
+        if not linha:
+            return None
+        assert linha.startswith(b"*")
+        comando = []
+        for _ in range(int(linha[1:-2])):
+            tamanho = int(self.rfile.readline()[1:-2])
+            comando.append(self.rfile.read(tamanho + 2)[:-2])
+        return comando
+
+    def handle(self):
+        while True:
+            comando = self._ler_comando()
+            if comando is None:
+                return
+            self.wfile.write(self._responder(comando))
+
+    @staticmethod
+    def _bulk(valor):
+        return b"$-1\r\n" if valor is None else b"$%d\r\n%s\r\n" % (len(valor), valor)
+
+    def _responder(self, comando):
+        nome, args = comando[0].decode().upper(), comando[1:]
+        servidor = self.server
+        servidor.comandos.append((nome, self.db, args))
+        if nome == "AUTH":
+            if args[-1].decode() != servidor.senha:
+                return b"-WRONGPASS invalid username-password pair\r\n"
+            self.autenticado = True
+            return b"+OK\r\n"
+        if not self.autenticado:
+            return b"-NOAUTH Authentication required.\r\n"
+        if nome == "SELECT":
+            self.db = int(args[0])
+            return b"+OK\r\n"
+        dados = servidor.bancos.setdefault(self.db, {})
+        chave = args[0].decode() if args else None
+        if nome == "HSET":
+            hash_ = dados.setdefault(chave, {})
+            novos = 0
+            for i in range(1, len(args), 2):
+                novos += args[i] not in hash_
+                hash_[args[i]] = args[i + 1]
+            return b":%d\r\n" % novos
+        if nome == "HGET":
+            return self._bulk(dados.get(chave, {}).get(args[1]))
+        if nome == "HGETALL":
+            hash_ = dados.get(chave, {})
+            return b"*%d\r\n" % (2 * len(hash_)) + b"".join(self._bulk(c) + self._bulk(v) for c, v in hash_.items())
+        if nome == "HDEL":
+            hash_ = dados.get(chave, {})
+            return b":%d\r\n" % sum(hash_.pop(c, None) is not None for c in args[1:])
+        if nome == "EXPIRE":
+            if chave not in dados:
+                return b":0\r\n"
+            servidor.ttls[(self.db, chave)] = int(args[1])
+            return b":1\r\n"
+        if nome == "DEL":
+            servidor.ttls.pop((self.db, chave), None)
+            return b":%d\r\n" % (dados.pop(chave, None) is not None)
+        return b"-ERR unknown command '%s'\r\n" % nome.encode()
+
+
+@pytest.fixture
+def servidor():
+    srv = _ServidorRESP()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def servidor_com_senha():
+    srv = _ServidorRESP(senha="s3nha")
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+# ==============================================================================
+# CLIENTE RESP / BACKEND REDIS
+# ==============================================================================
+def test_gravar_carregar_e_remover_campos(servidor):
+    backend = BackendRedis(servidor.url, ttl=120)
+    backend.gravar("abc", "v1", {"a": b"1", "b": b"\x00\r\n2"}, [])
+    assert backend.versao("abc") == "v1"
+    assert backend.carregar("abc") == ("v1", {"a": b"1", "b": b"\x00\r\n2"})
+    assert servidor.ttls[(0, "maxia:sessao:abc")] == 120
+
+    backend.gravar("abc", "v2", {"a": b"3"}, ["b"])
+    assert [c[0] for c in servidor.comandos[-3:]] == ["HSET", "HDEL", "EXPIRE"]
+    assert backend.carregar("abc") == ("v2", {"a": b"3"})
+
+    backend.apagar("abc")
+    assert backend.carregar("abc") == (None, {})
+    assert backend.versao("abc") is None
+
+
+def test_auth_e_select(servidor_com_senha):
+    host, porta = servidor_com_senha.server_address
+    cliente = ClienteRESP(f"redis://:s3nha@{host}:{porta}/3")
+    assert cliente.executar("HSET", "k", "c", "v") == 1
+    assert [c[0] for c in servidor_com_senha.comandos[:2]] == ["AUTH", "SELECT"]
+    assert servidor_com_senha.bancos[3]["k"] == {b"c": b"v"}
+
+    cliente_usuario = ClienteRESP(f"redis://app:s3nha@{host}:{porta}")
+    cliente_usuario.executar("HGET", "k", "c")
+    assert ("AUTH", 0, [b"app", b"s3nha"]) in servidor_com_senha.comandos
+
+
+def test_senha_errada_gera_erro_redis(servidor_com_senha):
+    host, porta = servidor_com_senha.server_address
+    with pytest.raises(ErroRedis):
+        ClienteRESP(f"redis://:errada@{host}:{porta}").executar("HGET", "k", "c")
+
+
+def test_erro_do_servidor_nao_derruba_a_conexao(servidor):
+    cliente = ClienteRESP(servidor.url)
+    with pytest.raises(ErroRedis):
+        cliente.executar("NAOEXISTE", "k")
+    assert cliente.executar("HSET", "k", "c", "v") == 1
+    assert servidor.conexoes == 1
+
+
+def test_reconecta_quando_a_conexao_cai(servidor_com_senha):
+    host, porta = servidor_com_senha.server_address
+    backend = BackendRedis(f"redis://:s3nha@{host}:{porta}/2")
+    backend.gravar("abc", "v1", {"a": b"1"}, [])
+    servidor_com_senha.derrubar_conexoes()
+    time.sleep(0.05)
+    # A nova conexão repete AUTH e SELECT antes do comando.
+    assert backend.carregar("abc") == ("v1", {"a": b"1"})
+    assert servidor_com_senha.conexoes == 2
+    assert [c[0] for c in servidor_com_senha.comandos[-3:]] == ["AUTH", "SELECT", "HGETALL"]
+
+
+def test_servidor_fora_do_ar_gera_erro(servidor):
+    url = servidor.url
+    servidor.shutdown()
+    servidor.server_close()
+    with pytest.raises(OSError):
+        ClienteRESP(url, timeout=0.5).executar("HGET", "k", "c")
+
+
+# ==============================================================================
+# BACKEND SQLITE
+# ==============================================================================
+def test_sqlite_remove_sessoes_expiradas(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "sessoes.sqlite3"), ttl=60)
+    backend.gravar("viva", "v1", {"a": b"1"}, [])
+    backend.ttl = -1
+    backend.gravar("vencida", "v1", {"a": b"1"}, [])
+    assert backend.versao("vencida") is None
+    assert backend.carregar("vencida") == (None, {})
+    assert backend.limpar_expiradas() == 1
+    assert backend.carregar("viva") == ("v1", {"a": b"1"})
+    assert backend._conn.execute("SELECT COUNT(*) FROM sessao_chaves").fetchone()[0] == 1
+
+
+# ==============================================================================
+# GERENCIADOR
+# ==============================================================================
+class _BackendContador(BackendSQLite):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gravacoes = []
+        self.limpezas = 0
+        self.consultas_versao = 0
+
+    def versao(self, sid):
+        self.consultas_versao += 1
+        return super().versao(sid)
+
+    def gravar(self, sid, versao, alteradas, removidas):
+        self.gravacoes.append((set(alteradas), list(removidas)))
+        super().gravar(sid, versao, alteradas, removidas)
+
+    def limpar_expiradas(self):
+        self.limpezas += 1
+        return super().limpar_expiradas()
+
+
+def test_serializacao_ida_e_volta():
+    valor = {"texto": "ç" * 5000, "lista": list(range(100)), "nada": None, "ok": True}
+    assert serializar(valor)[:1] == b"z"
+    assert desserializar(serializar(valor)) == valor
+    assert serializar(1) == b"j1"
+    assert desserializar(serializar(1)) == 1
+
+
+def test_nao_desserializa_pickle():
+    class _Explosivo:
+        def __reduce__(self):
+            return (exec, ("raise SystemExit('executou código')",))
+
+    carga = pickle.dumps(_Explosivo())
+    for blob in (b"p" + carga, b"j" + carga, b"z" + __import__("zlib").compress(carga)):
+        with pytest.raises(ValueError):
+            desserializar(blob)
+
+    backend = BackendSQLite(":memory:")
+    backend.gravar("s1", "v1", {"a": b"p" + carga, "b": serializar([1])}, [])
+    estado = {}
+    GerenciadorSessao(backend, {"a", "b"}).hidratar("s1", estado)
+    assert estado == {"b": [1]}
+
+
+def test_valor_fora_do_json_nao_e_persistido():
+    backend = _BackendContador(":memory:")
+    gerenciador = GerenciadorSessao(backend, {"a", "b"})
+    assert gerenciador.persistir("s1", {"a": object(), "b": 1}) == 1
+    assert backend.gravacoes[-1] == ({"b"}, [])
+
+
+def test_persistir_grava_so_o_que_mudou():
+    backend = _BackendContador(":memory:")
+    gerenciador = GerenciadorSessao(backend, {"a", "b", "c"})
+    estado = {"a": "x" * 2000, "b": [1, 2], "widget": "não persiste"}
+
+    assert gerenciador.persistir("s1", estado) == 2
+    assert gerenciador.persistir("s1", estado) == 0
+    estado["b"].append(3)
+    estado["c"] = 1
+    assert gerenciador.persistir("s1", estado) == 2
+    assert backend.gravacoes[-1] == ({"b", "c"}, [])
+    del estado["a"]
+    assert gerenciador.persistir("s1", estado) == 1
+    assert backend.gravacoes[-1] == (set(), ["a"])
+
+    restaurado = {}
+    GerenciadorSessao(backend, {"a", "b", "c"}).hidratar("s1", restaurado)
+    assert restaurado == {"b": [1, 2, 3], "c": 1}
+
+
+def test_persistir_regrava_tudo_se_outra_replica_gravou():
+    backend = _BackendContador(":memory:")
+    replica_1 = GerenciadorSessao(backend, {"a", "b"})
+    replica_2 = GerenciadorSessao(backend, {"a", "b"})
+    replica_1.persistir("s1", {"a": 1, "b": 2})
+    estado_2 = {}
+    replica_2.hidratar("s1", estado_2)
+    replica_1.persistir("s1", {"a": 1, "b": 3})
+    # A réplica 2 partiu de uma leitura que ficou velha: regrava tudo, não só a chave alterada.
+    estado_2["a"] = 10
+    assert replica_2.persistir("s1", estado_2) == 2
+    restaurado = {}
+    GerenciadorSessao(backend, {"a", "b"}).hidratar("s1", restaurado)
+    assert restaurado == {"a": 10, "b": 2}
+
+
+def test_rerun_sem_mudancas_nao_codifica_nem_consulta_o_backend(monkeypatch):
+    backend = _BackendContador(":memory:")
+    gerenciador = GerenciadorSessao(backend, {"construtor_state"})
+    fotos = [{"name": f"p{i}", "photo_b64": chr(65 + i) * 200_000} for i in range(5)]
+    estado = {"construtor_state": {"header_pitch": "oi", "products": fotos}}
+    gerenciador.persistir("s1", estado)
+
+    tamanhos = []
+    codificar = sessao_store._codificar
+    monkeypatch.setattr(sessao_store, "_codificar", lambda v: tamanhos.append(len(codificar(v))) or codificar(v))
+    consultas = backend.consultas_versao
+    assert gerenciador.persistir("s1", estado) == 0
+    assert max(tamanhos) < 1000  # só o esqueleto, sem as imagens
+    assert backend.consultas_versao == consultas
+
+    # Mudanças dentro do mesmo dict (mutação in-place) ou troca de uma imagem são detectadas.
+    estado["construtor_state"]["header_pitch"] = "novo"
+    assert gerenciador.persistir("s1", estado) == 1
+    fotos[0]["photo_b64"] = "Z" * 200_000
+    assert gerenciador.persistir("s1", estado) == 1
+    assert backend.consultas_versao == consultas  # este processo foi o último a gravar
+    restaurado = {}
+    GerenciadorSessao(backend, {"construtor_state"}).hidratar("s1", restaurado)
+    assert restaurado == estado
+
+
+def test_existe_so_para_sessoes_gravadas():
+    gerenciador = GerenciadorSessao(BackendSQLite(":memory:"), {"a"})
+    assert not gerenciador.existe(None)
+    assert not gerenciador.existe("inventado-pelo-cliente")
+    gerenciador.persistir("s1", {"a": 1})
+    assert gerenciador.existe("s1")
+    gerenciador.encerrar("s1")
+    assert not gerenciador.existe("s1")
+
+
+def test_limpeza_periodica_das_expiradas():
+    backend = _BackendContador(":memory:")
+    gerenciador = GerenciadorSessao(backend, {"a"}, intervalo_limpeza=0)
+    gerenciador.persistir("s1", {"a": 1})
+    gerenciador.persistir("s1", {"a": 2})
+    assert backend.limpezas == 2
+
+    gerenciador = GerenciadorSessao(backend, {"a"}, intervalo_limpeza=3600)
+    gerenciador.persistir("s1", {"a": 3})
+    assert backend.limpezas == 2
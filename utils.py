@@ -11,6 +11,8 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROMPTS_DIR = os.path.join(SCRIPT_DIR, "prompts")
 IMAGES_DIR = os.path.join(SCRIPT_DIR, "images")
 FONTS_DIR = os.path.join(SCRIPT_DIR, "fonts")
+# Dados locais gerados pelo app (índices, bancos SQLite). Pode ser trocado por um volume via variável de ambiente.
+DATA_DIR = os.environ.get("MAXIA_DATA_DIR", os.path.join(SCRIPT_DIR, "data"))
 # --- FIM DA MÁGICA ---
 
 @st.cache_data
@@ -34,3 +36,9 @@ def get_image_path(image_name):
 # Função para carregar fontes de forma robusta
 def get_font_path(font_name):
     return os.path.join(FONTS_DIR, font_name)
+
+# Função para obter caminhos de dados locais, criando o diretório se necessário
+def get_data_path(*partes):
+    caminho = os.path.join(DATA_DIR, *partes)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    return caminho